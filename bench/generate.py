@@ -0,0 +1,92 @@
+"""
+Synthetic scenarios for the benchmarks. The same arguments and seed always
+give the same file. Every wave places about 4 x T units, shared between the
+factions by --mix, on distinct cells. A --cluster fraction of them is drawn
+around --clusters centers with a standard deviation of --spread x N cells,
+the rest uniformly over the grid.
+
+    python bench/generate.py N W T R [--seed S] [--mix E,F,W,A] [--cluster FRACTION]
+                             [--clusters K] [--spread SIGMA] [-o scenario.txt]
+"""
+import argparse
+import random
+import sys
+
+FACTIONS = "EFWA"
+
+
+def faction_counts(units_per_faction, mix):
+    """
+    Units of every faction in a wave, 4 x units_per_faction split by the mix weights.
+    """
+    total = sum(mix)
+    return [round(4 * units_per_faction * weight / total) for weight in mix]
+
+
+def generate(n, waves, units_per_faction, rounds, seed=0, mix=(1, 1, 1, 1), cluster=0.0, clusters=1,
+             spread=0.1):
+    """
+    Lines of a scenario in the input format of main.py. The cluster centers
+    stay the same for all the waves, so clustered scenarios keep piling units
+    on the same parts of the grid.
+    """
+    rng = random.Random(seed)
+    centers = [(rng.randrange(n), rng.randrange(n)) for _ in range(clusters)]
+    counts = faction_counts(units_per_faction, mix)
+    # a wave cannot place more units than the grid has cells
+    counts = [count * n * n // max(sum(counts), n * n) for count in counts]
+
+    def position():
+        if rng.random() < cluster:
+            cx, cy = rng.choice(centers)
+            return (min(n - 1, max(0, round(rng.gauss(cx, spread * n)))),
+                    min(n - 1, max(0, round(rng.gauss(cy, spread * n)))))
+        return rng.randrange(n), rng.randrange(n)
+
+    yield f"{n} {waves} {units_per_faction} {rounds}"
+    for wave in range(1, waves + 1):
+        yield f"Wave {wave}:"
+        taken = set()
+        for faction, count in zip(FACTIONS, counts):
+            positions = []
+            while len(positions) < count:
+                cell = position()
+                if cell not in taken:
+                    taken.add(cell)
+                    positions.append(cell)
+            yield f"{faction}: " + ", ".join(f"{x} {y}" for x, y in positions)
+
+
+def write_scenario(path, *args, **kwargs):
+    with open(path, "w") as file:
+        for line in generate(*args, **kwargs):
+            file.write(line + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("n", type=int)
+    parser.add_argument("waves", type=int)
+    parser.add_argument("units_per_faction", type=int)
+    parser.add_argument("rounds", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", default="1,1,1,1", help="weights of the E, F, W and A units")
+    parser.add_argument("--cluster", type=float, default=0.0,
+                        help="fraction of the units placed around the cluster centers")
+    parser.add_argument("--clusters", type=int, default=1)
+    parser.add_argument("--spread", type=float, default=0.1,
+                        help="standard deviation of a cluster as a fraction of N")
+    parser.add_argument("-o", "--output", help="scenario file, standard output by default")
+    args = parser.parse_args()
+
+    scenario = (args.n, args.waves, args.units_per_faction, args.rounds, args.seed,
+                [float(weight) for weight in args.mix.split(",")], args.cluster, args.clusters, args.spread)
+    if args.output:
+        write_scenario(args.output, *scenario)
+    else:
+        for line in generate(*scenario):
+            sys.stdout.write(line + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Strong and weak scaling of the MPI engine on generated scenarios. Every run is
+`mpiexec -n <workers + 1> python src/main.py` with --profile, whose report
+gives the wall time of the slowest rank, the units on the blocks at every
+attack phase (units x rounds), the peak memory of every rank and the
+messages sent, by all the ranks and by the manager.
+
+Strong scaling plays the scenario of every --sizes grid with every --workers
+count, its efficiency is t(p0) x p0 / (t(p) x p) against the fewest workers
+p0. Weak scaling grows the grid with the workers, N = --weak-size x sqrt(p),
+with the same units per cell, its efficiency is t(p0) / t(p). Worker counts
+that leave a block less than 3 cells wide are skipped.
+
+The results are written as JSON with the commit they were measured on.
+--compare reads the results of another version and lists the runs whose
+rounds per second dropped by more than --tolerance, the exit status is 1 when
+there is one.
+
+    python bench/scaling_bench.py [--workers 1,4,9] [--sizes 72,144] [--weak-size 48]
+                                  [--args "--grid arrays"] [-o results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(BENCH, '..', 'src')
+sys.path.insert(0, SRC)
+
+from utils import Utils
+from generate import write_scenario
+
+# Settings that change the runs, results are only comparable when they match
+SCENARIO_SETTINGS = ('waves', 'rounds', 'density', 'mix', 'cluster', 'clusters', 'spread', 'seed', 'args')
+
+
+def parse_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+def fits(n, workers):
+    return n // max(Utils.choose_dims(workers)) >= 3
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    """
+    Generates the scenarios and runs them in a temporary directory.
+    """
+
+    def __init__(self, args, directory):
+        self.args = args
+        self.directory = directory
+
+    def scenario(self, n):
+        """
+        Scenario of an n x n grid, --density units per cell in every wave.
+        """
+        path = os.path.join(self.directory, f"scenario_{n}.txt")
+        if not os.path.exists(path):
+            units_per_faction = max(1, round(self.args.density * n * n / 4))
+            mix = [float(weight) for weight in self.args.mix.split(",")]
+            write_scenario(path, n, self.args.waves, units_per_faction, self.args.rounds, self.args.seed,
+                           mix, self.args.cluster, self.args.clusters, self.args.spread)
+        return path
+
+    def run(self, n, workers):
+        """
+        Best of --repeats runs of the scenario of an n x n grid with workers
+        workers, as a result entry.
+        """
+        report_file = os.path.join(self.directory, "report.json")
+        command = (shlex.split(self.args.mpiexec) + ["-n", str(workers + 1), sys.executable,
+                   os.path.join(SRC, "main.py"), self.scenario(n), os.path.join(self.directory, "output.txt"),
+                   "--profile", report_file] + shlex.split(self.args.args))
+        best = None
+        for _ in range(self.args.repeats):
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            with open(report_file) as file:
+                report = json.load(file)
+            if best is None or report['total']['seconds'] < best['total']['seconds']:
+                best = report
+
+        seconds = best['total']['seconds']
+        rounds = self.args.waves * self.args.rounds
+        unit_rounds = best['total']['phases'].get('attack', {}).get('units', 0)
+        manager = next(rank for rank in best['ranks'] if rank['rank'] == 0)
+        result = {
+            'n': n,
+            'workers': workers,
+            'seconds': seconds,
+            'rounds_per_second': rounds / seconds,
+            'unit_rounds_per_second': unit_rounds / seconds,
+            'peak_memory_kb': [rank['peak_memory_kb'] for rank in sorted(best['ranks'], key=lambda r: r['rank'])],
+            'messages': sum(counts['messages'] for counts in best['total']['tags'].values()),
+            'manager_messages': sum(counts['messages'] for counts in manager['tags'].values()),
+        }
+        print(f"  N={n:<5} workers={workers:<3} {seconds:8.3f} s {result['rounds_per_second']:9.2f} rounds/s "
+              f"{result['unit_rounds_per_second']:12.0f} unit rounds/s  "
+              f"peak {max(result['peak_memory_kb']) / 1024:.1f} MB/rank  "
+              f"{result['messages']} messages, {result['manager_messages']} from the manager", flush=True)
+        return result
+
+
+def strong_scaling(runner, sizes, worker_counts):
+    results = []
+    for n in sizes:
+        runs = [runner.run(n, workers) for workers in worker_counts if fits(n, workers)]
+        for run in runs:
+            run['efficiency'] = runs[0]['seconds'] * runs[0]['workers'] / (run['seconds'] * run['workers'])
+        results.extend(runs)
+    return results
+
+
+def weak_scaling(runner, weak_size, worker_counts):
+    runs = []
+    for workers in worker_counts:
+        n = round(weak_size * math.sqrt(workers))
+        if fits(n, workers):
+            runs.append(runner.run(n, workers))
+    for run in runs:
+        run['efficiency'] = runs[0]['seconds'] / run['seconds']
+    return runs
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the rounds per second of every run against the same run of the
+    baseline, returns the runs that are slower by more than tolerance.
+    """
+    regressions = []
+    for kind in ('strong', 'weak'):
+        old_runs = {(run['n'], run['workers']): run for run in baseline.get(kind, [])}
+        for run in results[kind]:
+            old = old_runs.get((run['n'], run['workers']))
+            if old is None:
+                continue
+            ratio = run['rounds_per_second'] / old['rounds_per_second']
+            slower = ratio < 1 - tolerance
+            print(f"  {kind:<6} N={run['n']:<5} workers={run['workers']:<3} {ratio:6.2f}x"
+                  f"{'  REGRESSION' if slower else ''}")
+            if slower:
+                regressions.append((kind, run['n'], run['workers'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="strong and weak scaling of the MPI engine")
+    parser.add_argument("--workers", default="1,4,9", help="worker counts, comma separated")
+    parser.add_argument("--sizes", default="72,144", help="grid sizes of the strong scaling")
+    parser.add_argument("--weak-size", type=int, default=48, help="grid size of one worker in the weak scaling")
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--density", type=float, default=0.05, help="units per cell in every wave")
+    parser.add_argument("--mix", default="1,1,1,1", help="weights of the E, F, W and A units")
+    parser.add_argument("--cluster", type=float, default=0.0, help="fraction of clustered units")
+    parser.add_argument("--clusters", type=int, default=1)
+    parser.add_argument("--spread", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=1, help="runs of every case, the fastest is kept")
+    parser.add_argument("--args", default="", help="extra options of main.py, e.g. \"--grid arrays\"")
+    parser.add_argument("--mpiexec", default="mpiexec", help="launcher and its options")
+    parser.add_argument("-o", "--output", default="scaling_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="results of another version to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdown in rounds per second reported as a regression")
+    args = parser.parse_args()
+
+    worker_counts = parse_list(args.workers)
+    with tempfile.TemporaryDirectory() as directory:
+        runner = Runner(args, directory)
+        print("strong scaling")
+        strong = strong_scaling(runner, parse_list(args.sizes), worker_counts)
+        print("weak scaling")
+        weak = weak_scaling(runner, args.weak_size, worker_counts)
+
+    results = {'commit': commit(), 'settings': vars(args), 'strong': strong, 'weak': weak}
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=1)
+
+    print(f"{'kind':<7}{'N':>6}{'workers':>8}{'seconds':>10}{'efficiency':>12}")
+    for kind in ('strong', 'weak'):
+        for run in results[kind]:
+            print(f"{kind:<7}{run['n']:>6}{run['workers']:>8}{run['seconds']:>10.3f}{run['efficiency']:>12.2f}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print(f"against {args.compare} ({baseline.get('commit')})")
+        different = [key for key in SCENARIO_SETTINGS
+                     if baseline.get('settings', {}).get(key) != results['settings'][key]]
+        if different:
+            print(f"  warning: the baseline was measured with other {', '.join(different)}")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Start-up time of the MPI engine as a function of the number of ranks. Every
+run plays a one wave, one round scenario with --profile, and reports the
+manager's setup (reading the header, the decomposition, the config broadcast
+and the block scatter), the slowest worker start-up (from the config to its
+block) and the whole run as seen from outside, MPI and Python start-up
+included.
+
+    python bench/startup_bench.py [--workers 1,4,9,16,25] [--mpiexec "mpiexec --oversubscribe"] [-o startup.json]
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(BENCH, '..', 'src')
+sys.path.insert(0, SRC)
+
+from utils import Utils
+from generate import write_scenario
+
+
+def main():
+    parser = argparse.ArgumentParser(description="start-up time of the MPI engine per number of ranks")
+    parser.add_argument("--workers", default="1,4,9,16,25", help="worker counts, comma separated")
+    parser.add_argument("--args", default="", help="extra options of main.py")
+    parser.add_argument("--mpiexec", default="mpiexec", help="launcher and its options")
+    parser.add_argument("-o", "--output", default="startup_results.json")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'ranks':>6}{'setup (ms)':>12}{'worker (ms)':>13}{'whole run (s)':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        scenario = os.path.join(directory, "scenario.txt")
+        report_file = os.path.join(directory, "report.json")
+        for workers in [int(value) for value in args.workers.split(",")]:
+            # blocks of 12 x 12 cells
+            n = 12 * max(Utils.choose_dims(workers))
+            write_scenario(scenario, n, 1, n, 1)
+            command = (shlex.split(args.mpiexec) + ["-n", str(workers + 1), sys.executable,
+                       os.path.join(SRC, "main.py"), scenario, os.path.join(directory, "output.txt"),
+                       "--profile", report_file] + shlex.split(args.args))
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            whole_run = time.perf_counter() - start
+
+            with open(report_file) as file:
+                ranks = json.load(file)['ranks']
+            setup = ranks[0]['phases']['setup']['seconds']
+            worker = max(rank['phases']['startup']['seconds'] for rank in ranks[1:])
+            results.append({'ranks': workers + 1, 'n': n, 'setup_seconds': setup,
+                            'worker_startup_seconds': worker, 'run_seconds': whole_run})
+            print(f"{workers + 1:>6}{setup * 1000:>12.1f}{worker * 1000:>13.1f}{whole_run:>15.2f}", flush=True)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Pickled objects against the numeric buffers of transport.py, for every kind of
+message the simulation sends. Prints the bytes on the wire and the one way
+latency measured with a ping-pong between two ranks.
+
+    mpiexec -n 2 python bench/transport_bench.py [N] [repeats]
+"""
+import os
+import pickle
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from mpi4py import MPI
+from block import Block
+from unit import AirUnit
+from utils import Utils
+from constants import UNIT_TYPES
+from transport import pack_records, send_records, recv_records, buffer_itemsize
+
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 144
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+
+def make_block(size):
+    """
+    A block of size x size cells, a quarter of them occupied.
+    """
+    Utils.N = size
+    random.seed(1)
+    units = [(random.choice('EFWA'), x, y) for x in range(size) for y in range(size) if random.random() < 0.25]
+    block = Block({"E": [], "F": [], "W": [], "A": []}, (0, 0), (size, size), 1, [], (size, size))
+    block.add_units(units)
+    return block, units
+
+
+def ping_pong(send, recv):
+    """
+    Average one way time of a message bounced between rank 0 and rank 1.
+    """
+    comm.Barrier()
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        if rank == 0:
+            send(1)
+            recv(1)
+        else:
+            recv(0)
+            send(0)
+    return (time.perf_counter() - start) / (2 * REPEATS)
+
+
+def pickled(obj):
+    return (len(pickle.dumps(obj, MPI.pickle.PROTOCOL)),
+            lambda dest: comm.send(obj, dest=dest, tag=0),
+            lambda source: comm.recv(source=source, tag=0))
+
+
+def buffered_records(records, width):
+    return (len(pack_records(records)) * buffer_itemsize(),
+            lambda dest: send_records(comm, records, dest=dest, tag=0),
+            lambda source: recv_records(comm, width, source=source, tag=0))
+
+
+def buffered_bytes(data):
+    def recv(source):
+        buffer = bytearray(len(data))
+        comm.Recv([buffer, MPI.BYTE], source=source, tag=0)
+    return (len(data),
+            lambda dest: comm.Send([data, MPI.BYTE], dest=dest, tag=0),
+            recv)
+
+
+def main():
+    block, units = make_block(N // 2)
+    block.reset_boundary()
+
+    air_units = []
+    for k in range(64):
+        air_unit = AirUnit(k, k)
+        air_unit.attack_power = 2 + k % 3
+        air_units.append(air_unit)
+    damage = [(k, k + 1, 1 + k % 6) for k in range(64)]
+    wave = units[:600]
+
+    messages = [
+        ('boundary strip', pickled(block.extract_boundary(1)), buffered_bytes(block.pack_boundary(1))),
+        ('wave units', pickled(wave),
+         buffered_records([(UNIT_TYPES.index(faction), x, y) for faction, x, y in wave], 3)),
+        ('damage batch', pickled(damage), buffered_records(damage, 3)),
+        ('air units', pickled(air_units), buffered_records([air_unit.to_record() for air_unit in air_units], 4)),
+        ('final block', pickled(block), buffered_bytes(block.pack_grid())),
+        ('state', pickled({'state': 4, 'current_worker_group': -1}), buffered_records([(4, -1)], 2)),
+    ]
+
+    rows = []
+    for name, (pickled_bytes, *pickled_path), (buffer_bytes, *buffer_path) in messages:
+        rows.append((name, pickled_bytes, buffer_bytes, ping_pong(*pickled_path), ping_pong(*buffer_path)))
+
+    if rank == 0:
+        print(f"block {N // 2}x{N // 2}, {REPEATS} round trips per message")
+        print(f"{'message':<16}{'pickled B':>11}{'buffer B':>10}{'pickled us':>12}{'buffer us':>11}")
+        for name, pickled_bytes, buffer_bytes, pickled_time, buffer_time in rows:
+            print(f"{name:<16}{pickled_bytes:>11}{buffer_bytes:>10}"
+                  f"{pickled_time * 1e6:>12.1f}{buffer_time * 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Memory and pickle size of the units of every faction. Prints the bytes
+allocated per unit when many are created and the size of one pickled unit and
+of a pickled list of them.
+
+    python bench/unit_bench.py [count]
+"""
+import os
+import pickle
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from unit import EarthUnit, FireUnit, WaterUnit, AirUnit
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+
+def allocated_per_unit(unit_class):
+    """
+    Bytes allocated per unit while COUNT units are alive.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    units = [unit_class(k, k) for k in range(COUNT)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list holding the units is not part of them
+    return (after - before - sys.getsizeof(units)) / len(units)
+
+
+def main():
+    print(f"{COUNT} units per faction")
+    print(f"{'unit':<11}{'bytes/unit':>12}{'pickled B':>11}{'list B/unit':>13}")
+    for unit_class in (EarthUnit, FireUnit, WaterUnit, AirUnit):
+        units = [unit_class(k, k) for k in range(1000)]
+        single = len(pickle.dumps(units[0], pickle.HIGHEST_PROTOCOL))
+        listed = len(pickle.dumps(units, pickle.HIGHEST_PROTOCOL)) / len(units)
+        print(f"{unit_class.__name__:<11}{allocated_per_unit(unit_class):>12.1f}{single:>11}{listed:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
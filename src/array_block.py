@@ -0,0 +1,413 @@
+import numpy as np
+from block import Block
+from unit import AirUnit
+from utils import Utils
+from constants import EARTH, FIRE, WATER, AIR, FIRE_MAX_ATTACK, UNIT_TYPES, ADJACENT_CELLS
+
+# Faction codes stored in the arrays, 0 is an empty cell
+FACTION_CODES = {unit_type: code for code, unit_type in enumerate(UNIT_TYPES)}
+EMPTY, EARTH_CODE, FIRE_CODE, WATER_CODE, AIR_CODE = range(5)
+
+# Per faction constants indexed by faction code
+FACTIONS = [EARTH, FIRE, WATER, AIR]
+MAX_HEALTH = np.array([0] + [faction['HEALTH'] for faction in FACTIONS], dtype=np.int16)
+BASE_ATTACK = np.array([0] + [faction['ATTACK'] for faction in FACTIONS], dtype=np.int16)
+HEALING = np.array([0] + [faction['HEALING'] for faction in FACTIONS], dtype=np.int16)
+DIRECTIONS = [[]] + [faction['DIRECTIONS'] for faction in FACTIONS]
+
+TYPE_CHARS = np.array(UNIT_TYPES)
+# unit type characters as bytes and back, for boundaries sent as raw buffers
+TYPE_BYTES = np.frombuffer(''.join(UNIT_TYPES).encode('ascii'), dtype=np.uint8)
+BYTE_CODES = np.zeros(256, dtype=np.int8)
+BYTE_CODES[TYPE_BYTES] = np.arange(len(UNIT_TYPES))
+
+
+def to_codes(boundary):
+    """
+    Converts rows of unit type characters into an int8 array of faction codes.
+    """
+    return np.array([[FACTION_CODES[cell] for cell in row] for row in boundary], dtype=np.int8)
+
+
+class ArrayBlock(Block):
+    """
+    Structure-of-arrays version of Block. Units are not objects but entries of
+    parallel arrays, one per unit field:
+      faction         int8   faction code, EMPTY where there is no unit
+      health          int16
+      damage_taken    int16
+      attack_power    int16
+      attack_done     bool
+      inferno_targets uint8  bit k is set when a fire unit hit FIRE['DIRECTIONS'][k]
+                             this round, which replaces FireUnit.enemies_attacked
+    grid_with_boundary holds faction codes, so the phases are whole-array operations.
+    """
+
+    def create_grid(self):
+        shape = (self.size[1], self.size[0])
+        self.faction = np.zeros(shape, dtype=np.int8)
+        self.health = np.zeros(shape, dtype=np.int16)
+        self.damage_taken = np.zeros(shape, dtype=np.int16)
+        self.attack_power = np.zeros(shape, dtype=np.int16)
+        self.attack_done = np.zeros(shape, dtype=bool)
+        self.inferno_targets = np.zeros(shape, dtype=np.uint8)
+        self.grid_with_boundary = np.zeros((shape[0] + 6, shape[1] + 6), dtype=np.int8)
+
+    # view of a padded array shifted by (dx, dy) with the shape of the block
+    def shifted(self, padded, dx, dy):
+        height, width = self.faction.shape
+        return padded[3 + dx:3 + dx + height, 3 + dy:3 + dy + width]
+
+    def set_unit(self, i, j, code):
+        self.faction[i, j] = code
+        self.health[i, j] = MAX_HEALTH[code]
+        self.attack_power[i, j] = BASE_ATTACK[code]
+        self.damage_taken[i, j] = 0
+        self.attack_done[i, j] = False
+        self.inferno_targets[i, j] = 0
+
+    def clear(self, mask):
+        self.faction[mask] = EMPTY
+        self.health[mask] = 0
+        self.attack_power[mask] = 0
+        self.damage_taken[mask] = 0
+        self.attack_done[mask] = False
+        self.inferno_targets[mask] = 0
+
+    def get_grid_with_boundary_element(self, x, y):
+        return UNIT_TYPES[self.grid_with_boundary[x - self.top_left[0] + 3, y - self.top_left[1] + 3]]
+
+    def set_grid_with_boundary_element(self, x, y, el):
+        self.grid_with_boundary[x - self.top_left[0] + 3, y - self.top_left[1] + 3] = FACTION_CODES[el]
+
+    def boundary_slice(self, position):
+        """
+        Slice of grid_with_boundary that the boundary at position is written to,
+        positions are numbered like in Block.update_boundary.
+        """
+        height, width = self.faction.shape
+        return [
+            (slice(0, 3), slice(0, 3)),
+            (slice(0, 3), slice(3, width + 3)),
+            (slice(0, 3), slice(width + 3, width + 6)),
+            (slice(3, height + 3), slice(width + 3, width + 6)),
+            (slice(height + 3, height + 6), slice(width + 3, width + 6)),
+            (slice(height + 3, height + 6), slice(3, width + 3)),
+            (slice(height + 3, height + 6), slice(0, 3)),
+            (slice(3, height + 3), slice(0, 3)),
+        ][position]
+
+    def update_boundary(self, boundary, position):
+        self.grid_with_boundary[self.boundary_slice(position)] = to_codes(boundary)
+
+    def reset_boundary(self):
+        self.grid_with_boundary[3:-3, 3:-3] = self.faction
+
+    def unit_types(self):
+        return TYPE_CHARS[self.faction].tolist()
+
+    def extract_codes(self, position):
+        """
+        Faction codes of the 3 wide strip of the block that the neighbor at
+        position needs.
+        """
+        return self.faction[[
+            (slice(0, 3), slice(0, 3)),
+            (slice(0, 3), slice(None)),
+            (slice(0, 3), slice(-3, None)),
+            (slice(None), slice(-3, None)),
+            (slice(-3, None), slice(-3, None)),
+            (slice(-3, None), slice(None)),
+            (slice(-3, None), slice(0, 3)),
+            (slice(None), slice(0, 3)),
+        ][position]]
+
+    def extract_boundary(self, position):
+        return TYPE_CHARS[self.extract_codes(position)].tolist()
+
+    def pack_boundary(self, position):
+        return TYPE_BYTES[self.extract_codes(position)].tobytes()
+
+    def pack_grid(self):
+        return TYPE_BYTES[self.faction].tobytes()
+
+    # cells of the block inside a rectangle in global coordinates
+    def cells(self, top_left, bottom_right):
+        return (slice(top_left[0] - self.top_left[0], bottom_right[0] - self.top_left[0]),
+                slice(top_left[1] - self.top_left[1], bottom_right[1] - self.top_left[1]))
+
+    def pack_cells(self, top_left, bottom_right):
+        cells = self.cells(top_left, bottom_right)
+        return np.stack([self.faction[cells], self.health[cells], self.attack_power[cells]],
+                        axis=-1).astype(np.int16).tobytes()
+
+    def unpack_cells(self, top_left, bottom_right, buffer):
+        cells = self.cells(top_left, bottom_right)
+        values = np.frombuffer(buffer, dtype=np.int16).reshape(bottom_right[0] - top_left[0],
+                                                               bottom_right[1] - top_left[1], 3)
+        self.faction[cells] = values[..., 0]
+        self.health[cells] = values[..., 1]
+        self.attack_power[cells] = values[..., 2]
+
+    def pack_round_cells(self, top_left, bottom_right):
+        """
+        pack_cells with the inferno targets as a fourth value, which together
+        are the whole state of a cell between two rounds of a wave.
+        """
+        cells = self.cells(top_left, bottom_right)
+        return np.stack([self.faction[cells], self.health[cells], self.attack_power[cells],
+                         self.inferno_targets[cells]], axis=-1).astype(np.int16).tobytes()
+
+    def unpack_round_cells(self, top_left, bottom_right, buffer):
+        cells = self.cells(top_left, bottom_right)
+        values = np.frombuffer(buffer, dtype=np.int16).reshape(bottom_right[0] - top_left[0],
+                                                               bottom_right[1] - top_left[1], 4)
+        self.faction[cells] = values[..., 0]
+        self.health[cells] = values[..., 1]
+        self.attack_power[cells] = values[..., 2]
+        self.inferno_targets[cells] = values[..., 3]
+
+    def unpack_boundary(self, buffer, position):
+        codes = BYTE_CODES[np.frombuffer(buffer, dtype=np.uint8)]
+        self.grid_with_boundary[self.boundary_slice(position)] = codes.reshape(self.boundary_shape(position))
+
+    def patch_boundary(self, position, indices, values):
+        boundary = self.grid_with_boundary[self.boundary_slice(position)]
+        boundary.flat[np.asarray(indices, dtype=np.intp)] = BYTE_CODES[np.frombuffer(values, dtype=np.uint8)]
+
+    def region_mask(self, region):
+        mask = np.zeros(self.faction.shape, dtype=bool)
+        mask[3:-3, 3:-3] = True
+        if region is None:
+            mask[:] = True
+        elif region == 'ring':
+            mask = ~mask
+        return mask
+
+    def is_empty(self, x, y):
+        i, j = self.get_block_coordinates(x, y)
+        return self.faction[i, j] == EMPTY
+
+    def unit_count(self):
+        return int(np.count_nonzero(self.faction != EMPTY))
+
+    def units_per_line(self):
+        occupied = self.faction != EMPTY
+        return np.count_nonzero(occupied, axis=1).tolist(), np.count_nonzero(occupied, axis=0).tolist()
+
+    def count_units(self, top_left, bottom_right):
+        (i0, j0), (i1, j1) = self.get_block_coordinates(*top_left), self.get_block_coordinates(*bottom_right)
+        return int(np.count_nonzero(self.faction[i0:i1, j0:j1] != EMPTY))
+
+    def unit_positions(self, unit_type, region=None):
+        units = (self.faction == FACTION_CODES[unit_type]) & self.region_mask(region)
+        return [self.get_grid_coordinate(int(i), int(j)) for i, j in np.argwhere(units)]
+
+    def add_units(self, units):
+        for faction, x, y in units:
+            i, j = self.get_block_coordinates(x, y)
+            if self.faction[i, j] == EMPTY:
+                self.set_unit(i, j, FACTION_CODES[faction])
+
+    def attack(self, outgoing_damage):
+        damage = self.attack_damage()
+        # What is left on the boundary belongs to the neighbors
+        rows, columns = np.nonzero(damage)
+        xs, ys = rows + self.top_left[0] - 3, columns + self.top_left[1] - 3
+        block_ids = Utils.coordinates_to_block_ids(xs, ys)
+        for block_id, x, y, dealt in zip(block_ids.tolist(), xs.tolist(), ys.tolist(), damage[rows, columns].tolist()):
+            outgoing_damage[block_id].append((x, y, dealt))
+
+    def attack_damage(self):
+        """
+        Every unit attacks at once. For each faction and each of its directions the
+        boundary grid is shifted onto the block, so a direction is one array
+        comparison for all the units of that faction. Damage to the block is
+        taken right away, the damage to boundary cells is returned in an array
+        shaped like grid_with_boundary.
+        """
+        padded = self.grid_with_boundary
+        damage = np.zeros(padded.shape, dtype=np.int16)
+        can_attack = (self.faction != EMPTY) & (self.health >= MAX_HEALTH[self.faction] // 2)
+
+        for code in (EARTH_CODE, FIRE_CODE, WATER_CODE, AIR_CODE):
+            attackers = can_attack & (self.faction == code)
+            if not attackers.any():
+                continue
+            for k, (dx, dy) in enumerate(DIRECTIONS[code]):
+                target = self.shifted(padded, dx, dy)
+                hit = attackers & (target != EMPTY) & (target != code)
+                self.shifted(damage, dx, dy)[...] += np.where(hit, self.attack_power, 0).astype(np.int16)
+                self.attack_done |= hit
+                if code == FIRE_CODE:
+                    self.inferno_targets |= hit.astype(np.uint8) << np.uint8(k)
+                elif code == AIR_CODE:
+                    # Air units pierce through an empty cell to the one behind it
+                    beyond = self.shifted(padded, 2 * dx, 2 * dy)
+                    hit = attackers & (target == EMPTY) & (beyond != EMPTY) & (beyond != code)
+                    self.shifted(damage, 2 * dx, 2 * dy)[...] += np.where(hit, self.attack_power, 0).astype(np.int16)
+                    self.attack_done |= hit
+
+        self.damage_taken += damage[3:-3, 3:-3]
+        damage[3:-3, 3:-3] = 0
+        return damage
+
+    def take_damage(self, incoming_damage):
+        for damages in incoming_damage.values():
+            for x, y, damage in damages:
+                i, j = self.get_block_coordinates(x, y)
+                self.damage_taken[i, j] += damage
+
+    def resolve(self):
+        # Earth units fortify before the damage is applied
+        earth = self.faction == EARTH_CODE
+        self.damage_taken[earth] //= 2
+
+        self.health -= self.damage_taken
+        self.damage_taken[:] = 0
+        self.clear((self.faction != EMPTY) & (self.health <= 0))
+
+    def heal(self):
+        healing = (self.faction != EMPTY) & ~self.attack_done
+        healed = np.minimum(MAX_HEALTH[self.faction], self.health + HEALING[self.faction])
+        np.copyto(self.health, healed, where=healing, casting='unsafe')
+        self.attack_done[:] = False
+
+    def apply_inferno(self, region=None):
+        fire = (self.faction == FIRE_CODE) & self.region_mask(region)
+        available = np.zeros(fire.shape, dtype=bool)
+        for k, (dx, dy) in enumerate(FIRE['DIRECTIONS']):
+            attacked = (self.inferno_targets >> np.uint8(k)) & 1
+            # the attacked enemy is dead if its cell is empty now
+            available |= fire & (attacked == 1) & (self.shifted(self.grid_with_boundary, dx, dy) == EMPTY)
+
+        self.attack_power[available & (self.attack_power < FIRE_MAX_ATTACK)] += 1
+        self.inferno_targets[fire] = 0
+
+    def air_moves(self, region=None):
+        """
+        Plans the moves of all the air units at once. The number of enemies in
+        range is counted for every cell the units may end up on, the block and
+        the first ring of the boundary, with one shifted comparison per
+        direction. A unit leaves its own cell empty while it looks around, so a
+        neighbor cell q = p + d of a unit at p also sees the enemy behind p, at
+        p - d, through it. Scores are laid out as staying followed by
+        ADJACENT_CELLS, so argmax keeps the first best cell like air_movement.
+        """
+        padded = self.grid_with_boundary
+        height, width = padded.shape
+        enemy = (padded != EMPTY) & (padded != AIR_CODE)
+        empty = padded == EMPTY
+
+        # view of a padded array on the cells the units may end up on, shifted by (dx, dy)
+        def window(array, dx, dy):
+            return array[2 + dx:height - 2 + dx, 2 + dy:width - 2 + dy]
+
+        counts = np.zeros((height - 4, width - 4), dtype=np.int8)
+        for dx, dy in AIR['DIRECTIONS']:
+            # Air units see through an empty cell to the one behind it
+            counts += window(enemy, dx, dy) | (window(empty, dx, dy) & window(enemy, 2 * dx, 2 * dy))
+
+        rows = np.arange(self.top_left[0] - 1, self.bottom_right[0] + 1)
+        columns = np.arange(self.top_left[1] - 1, self.bottom_right[1] + 1)
+        inside = ((rows >= 0) & (rows < Utils.N))[:, None] & ((columns >= 0) & (columns < Utils.N))[None, :]
+        candidates = np.where(inside & window(empty, 0, 0), counts, -1)
+
+        i, j = np.nonzero((self.faction == AIR_CODE) & self.region_mask(region))
+        scores = np.empty((len(i), len(ADJACENT_CELLS) + 1), dtype=np.int8)
+        scores[:, 0] = counts[i + 1, j + 1]
+        for k, (dx, dy) in enumerate(ADJACENT_CELLS):
+            score = candidates[i + 1 + dx, j + 1 + dy]
+            scores[:, k + 1] = np.where(score >= 0, score + enemy[i + 3 - dx, j + 3 - dy], -1)
+        moves = np.array([(0, 0)] + ADJACENT_CELLS)[np.argmax(scores, axis=1)]
+
+        xs, ys = (i + self.top_left[0]).tolist(), (j + self.top_left[1]).tolist()
+        return {(x, y): (x + dx, y + dy) for x, y, (dx, dy) in zip(xs, ys, moves.tolist())}
+
+    def flood(self):
+        """
+        Cells of the block flooded at the end of the wave. A water unit floods the
+        first cell of ADJACENT_CELLS that is inside the grid and empty, so the
+        units on the boundary next to the block are followed too.
+        """
+        height, width = self.faction.shape
+        rows = np.arange(self.top_left[0] - 3, self.bottom_right[0] + 3)
+        columns = np.arange(self.top_left[1] - 3, self.bottom_right[1] + 3)
+        inside = ((rows >= 0) & (rows < Utils.N))[:, None] & ((columns >= 0) & (columns < Utils.N))[None, :]
+        free = inside & (self.grid_with_boundary == EMPTY)
+
+        # water units on the block and the first ring of the boundary
+        flooding = self.grid_with_boundary[2:height + 4, 2:width + 4] == WATER_CODE
+        flooded = np.zeros(free.shape, dtype=bool)
+        for dx, dy in ADJACENT_CELLS:
+            target = (slice(2 + dx, height + 4 + dx), slice(2 + dy, width + 4 + dy))
+            hit = flooding & free[target]
+            flooded[target] |= hit
+            flooding &= ~hit
+
+        return [self.get_grid_coordinate(int(i), int(j)) for i, j in np.argwhere(flooded[3:-3, 3:-3])]
+
+    def reset_inferno(self):
+        fire = self.faction == FIRE_CODE
+        self.attack_power[fire] = FIRE['ATTACK']
+        self.inferno_targets[fire] = 0
+
+    def place_water_units(self, water_units):
+        for x, y in water_units:
+            i, j = self.get_block_coordinates(x, y)
+            self.set_unit(i, j, WATER_CODE)
+
+    def remove_air_units(self):
+        air = self.faction == AIR_CODE
+        air_units = []
+        for i, j in np.argwhere(air):
+            air_unit = AirUnit(*self.get_grid_coordinate(int(i), int(j)))
+            air_unit.health = int(self.health[i, j])
+            air_unit.attack_power = int(self.attack_power[i, j])
+            air_unit.damage_taken = int(self.damage_taken[i, j])
+            air_unit.attack_done = bool(self.attack_done[i, j])
+            air_units.append(air_unit)
+        self.clear(air)
+        return air_units
+
+    def place_air_unit(self, air_unit: AirUnit):
+        i, j = self.get_block_coordinates(air_unit.x, air_unit.y)
+        if self.faction[i, j] == EMPTY:
+            self.faction[i, j] = AIR_CODE
+            self.health[i, j] = air_unit.health
+            self.attack_power[i, j] = air_unit.attack_power
+            self.damage_taken[i, j] = air_unit.damage_taken
+            self.attack_done[i, j] = air_unit.attack_done
+            self.inferno_targets[i, j] = 0
+        else:
+            # same as AirUnit.unite
+            self.health[i, j] = min(AIR['HEALTH'], int(self.health[i, j]) + air_unit.health)
+            self.attack_power[i, j] += air_unit.attack_power
+
+    def play_round(self):
+        """
+        A whole round of the block on its own, with an empty boundary: the
+        serial engine's grid, or a block with deep halos whose margin absorbs
+        the cells that are wrong without their neighbors. Air units that move
+        off the block are dropped, damage to the boundary is lost.
+        """
+        self.reset_boundary()
+        self.apply_inferno()
+
+        # Every move is planned on the grid before any air unit moves
+        air_moves = self.air_moves()
+        for air_unit in self.remove_air_units():
+            air_unit.change_position(air_moves[(air_unit.x, air_unit.y)])
+            if self.is_coordinate_inside(air_unit.x, air_unit.y):
+                self.place_air_unit(air_unit)
+
+        self.reset_boundary()
+        self.attack_damage()
+        self.resolve()
+        self.heal()
+
+    # flooding and the inferno reset after the last round of a wave, like play_round
+    def end_wave(self):
+        self.reset_boundary()
+        self.place_water_units(self.flood())
+        self.reset_inferno()
@@ -1,4 +1,79 @@
-from unit import EarthUnit, FireUnit, WaterUnit, AirUnit
+from array import array
+from unit import Unit, EarthUnit, FireUnit, WaterUnit, AirUnit
+from utils import Utils
+from constants import AIR, NEIGHBOR_OFFSETS, ADJACENT_CELLS, UNIT_TYPES
+
+UNIT_CLASSES = {'E': EarthUnit, 'F': FireUnit, 'W': WaterUnit, 'A': AirUnit}
+
+# id, top_left, bottom_right, size and (block_id, position) of up to 8 neighbors
+GEOMETRY_SIZE = 7 + 2 * 8
+
+
+def block_class(grid):
+    """
+    Block class for the --grid option.
+    """
+    if grid == "arrays":
+        # NumPy is only needed for the array representation
+        from array_block import ArrayBlock
+        return ArrayBlock
+    return Block
+
+
+# Generate blocks and block ids
+def generate_blocks(block_sizes, block_class):
+    blocks = []
+    block_ids = []
+    block_id = 1
+
+    top_left = (0, 0)
+    for i in range(len(block_sizes)):
+        block_top_left = top_left
+        block_ids.append([])
+        for j in range(len(block_sizes[i])):
+            width, height = block_sizes[i][j]
+            bottom_right = (
+                block_top_left[0] + height,
+                block_top_left[1] + width
+            )
+            blocks.append(
+                block_class(
+                    {"E": [], "F": [], "W": [], "A": []},
+                    block_top_left,
+                    bottom_right,
+                    block_id,
+                    [],
+                    block_sizes[i][j]
+                )
+            )
+            block_ids[i].append(block_id)
+            block_id += 1
+            block_top_left = (block_top_left[0], block_top_left[1] + width)
+        top_left = (top_left[0] + block_sizes[i][0][1], top_left[1])
+
+    return blocks, block_ids
+
+
+# Calculate adjacent blocks for each block    
+def calculate_adjacent_blocks(block_ids, blocks):
+    for i in range(len(block_ids)):
+        for j in range(len(block_ids[i])):
+            adjacent_blocks = []
+            # from top-left to left clockwise [0, 1, 2]
+            #                                 [7, x, 3]
+            #                                 [6, 5, 4]
+            dx = [-1,  0,  1,  1,  1,  0, -1, -1]
+            dy = [-1, -1, -1,  0,  1,  1,  1,  0]  
+            for k in range(8):
+                y = i + dy[k]
+                x = j + dx[k]
+                if 0 <= y < len(block_ids) and 0 <= x < len(block_ids[i]):
+                    adjacent_blocks.append({
+                        'block_id': block_ids[y][x],
+                        'position': k,
+                        'relative_position': (dx[k], dy[k])
+                    })
+            blocks[block_ids[i][j] - 1].adjacent_blocks = adjacent_blocks
 
 
 class Block:
@@ -9,8 +84,51 @@ class Block:
         self.id = id
         self.adjacent_blocks = adjacent_blocks
         self.size = size
+        self.create_grid()
+
+    def pack_geometry(self):
+        """
+        Everything a worker needs to rebuild its empty block, as a fixed size
+        list of ints. Missing neighbors are padded with -1.
+        """
+        values = [self.id, *self.top_left, *self.bottom_right, *self.size]
+        for neighbor in self.adjacent_blocks:
+            values += [neighbor['block_id'], neighbor['position']]
+        return values + [-1] * (GEOMETRY_SIZE - len(values))
+
+    @classmethod
+    def from_geometry(cls, values):
+        adjacent_blocks = []
+        for k in range(7, GEOMETRY_SIZE, 2):
+            if values[k] != -1:
+                adjacent_blocks.append({
+                    'block_id': values[k],
+                    'position': values[k + 1],
+                    'relative_position': NEIGHBOR_OFFSETS[values[k + 1]]
+                })
+        return cls({"E": [], "F": [], "W": [], "A": []}, (values[1], values[2]), (values[3], values[4]),
+                   values[0], adjacent_blocks, (values[5], values[6]))
+
+    def create_grid(self):
         self.grid = [['.' for _ in range(self.size[0])] for _ in range(self.size[1])]
         self.grid_with_boundary = [['.' for _ in range(self.size[0] + 6)] for _ in range(self.size[1] + 6)]
+        # occupied cells of each faction, (i, j) in block coordinates -> unit
+        self.active = {unit_type: {} for unit_type in UNIT_CLASSES}
+
+    # puts a unit on a cell of the grid, '.' empties it, keeping the index of occupied cells
+    def set_cell(self, i, j, unit):
+        previous = self.grid[i][j]
+        if previous != '.':
+            del self.active[previous.unit_type][(i, j)]
+        self.grid[i][j] = unit
+        if unit != '.':
+            self.active[unit.unit_type][(i, j)] = unit
+
+    # (i, j, unit) of every occupied cell, of the given factions or of all of them
+    def occupied_cells(self, unit_types=None):
+        for unit_type in unit_types or self.active:
+            for (i, j), unit in list(self.active[unit_type].items()):
+                yield i, j, unit
 
     def get_block_coordinates(self, x, y):
         return (x - self.top_left[0], y - self.top_left[1])
@@ -81,9 +199,161 @@ class Block:
 
     
     def reset_boundary(self):
+        empty_row = ['.'] * self.size[0]
         for i in range(self.size[1]):
-            for j in range(self.size[0]):
-                self.grid_with_boundary[i + 3][j + 3] = self.grid[i][j].unit_type if self.grid[i][j] != "." else "."
+            self.grid_with_boundary[i + 3][3:self.size[0] + 3] = empty_row
+        for i, j, unit in self.occupied_cells():
+            self.grid_with_boundary[i + 3][j + 3] = unit.unit_type
+
+    def unit_types(self):
+        """
+        Returns the block as rows of unit type characters, '.' for empty cells.
+        """
+        return [[cell.unit_type if cell != '.' else '.' for cell in row] for row in self.grid]
+
+    def extract_block(self, position):
+        """
+        Extracts specific 'boundary' sub-grids to send to neighbors.
+        Each position corresponds to a direction around the block:
+          0 -> top-left corner, 1 -> top edge, 2 -> top-right corner, etc.
+        """
+        # Example extraction size is 3x3, but can be adjusted as needed
+        if position == 0:
+            return [row[0:3] for row in self.grid[0:3]]
+        elif position == 1:
+            return [row[:] for row in self.grid[0:3]]
+        elif position == 2:
+            return [row[-3:] for row in self.grid[0:3]]
+        elif position == 3:
+            return [row[-3:] for row in self.grid]
+        elif position == 4:
+            return [row[-3:] for row in self.grid[-3:]]
+        elif position == 5:
+            return [row[:] for row in self.grid[-3:]]
+        elif position == 6:
+            return [row[0:3] for row in self.grid[-3:]]
+        elif position == 7:
+            return [row[0:3] for row in self.grid]
+        # Default empty if position is somehow out of range
+        return []
+
+    def extract_boundary(self, position):
+        """
+        Same as extract_block but with units replaced by their unit_type,
+        which is all a neighbor needs for its grid_with_boundary.
+        """
+        extracted_data = self.extract_block(position)
+        for i in range(len(extracted_data)):
+            for j in range(len(extracted_data[0])):
+                if extracted_data[i][j] != '.':
+                    extracted_data[i][j] = extracted_data[i][j].unit_type
+        return extracted_data
+
+    # shape of the boundary that the neighbor at position sends
+    def boundary_shape(self, position):
+        if position in (1, 5):
+            return (3, self.size[0])
+        if position in (3, 7):
+            return (self.size[1], 3)
+        return (3, 3)
+
+    def pack_boundary(self, position):
+        """
+        Boundary for the neighbor at position as one byte per cell, the unit
+        type character or '.', so it can be sent without pickling.
+        """
+        return ''.join(''.join(row) for row in self.extract_boundary(position)).encode('ascii')
+
+    # the whole block as one byte per cell, rows one after the other
+    def pack_grid(self):
+        return ''.join(''.join(row) for row in self.unit_types()).encode('ascii')
+
+    def pack_cells(self, top_left, bottom_right):
+        """
+        (faction code, health, attack power) of every cell of a rectangle of the
+        block in global coordinates, row by row, as int16 bytes. Cells only move
+        between blocks after a wave, when nothing else of a unit is left to keep.
+        """
+        values = array('h')
+        for x in range(top_left[0], bottom_right[0]):
+            for y in range(top_left[1], bottom_right[1]):
+                unit = self.get_grid_element(x, y)
+                if unit == '.':
+                    values.extend((0, 0, 0))
+                else:
+                    values.extend((UNIT_TYPES.index(unit.unit_type), unit.health, unit.attack_power))
+        return values.tobytes()
+
+    def unpack_cells(self, top_left, bottom_right, buffer):
+        values = array('h')
+        values.frombytes(buffer)
+        k = 0
+        for x in range(top_left[0], bottom_right[0]):
+            for y in range(top_left[1], bottom_right[1]):
+                code, health, attack_power = values[k:k + 3]
+                k += 3
+                if code:
+                    unit = UNIT_CLASSES[UNIT_TYPES[code]](x, y)
+                    unit.health = health
+                    unit.attack_power = attack_power
+                    self.set_cell(x - self.top_left[0], y - self.top_left[1], unit)
+
+    def unpack_boundary(self, buffer, position):
+        rows, columns = self.boundary_shape(position)
+        cells = bytes(buffer).decode('ascii')
+        self.update_boundary([list(cells[i * columns:(i + 1) * columns]) for i in range(rows)], position)
+
+    # cell of grid_with_boundary where the boundary at position starts
+    def boundary_origin(self, position):
+        return [(0, 0), (0, 3), (0, self.size[0] + 3), (3, self.size[0] + 3),
+                (self.size[1] + 3, self.size[0] + 3), (self.size[1] + 3, 3), (self.size[1] + 3, 0), (3, 0)][position]
+
+    def patch_boundary(self, position, indices, values):
+        """
+        Writes only some cells of the boundary at position, given by their index
+        in the strip and their new unit type byte.
+        """
+        row, column = self.boundary_origin(position)
+        columns = self.boundary_shape(position)[1]
+        for k, value in zip(indices, values):
+            self.grid_with_boundary[row + k // columns][column + k % columns] = chr(value)
+
+    def in_region(self, i, j, region):
+        """
+        Regions split the block by whether a cell needs the boundary: 'interior'
+        cells are more than 3 cells away from the edge, so nothing they look at
+        is on the boundary, 'ring' is the rest and None is the whole block.
+        """
+        if region is None:
+            return True
+        interior = 3 <= i < self.size[1] - 3 and 3 <= j < self.size[0] - 3
+        return interior == (region == 'interior')
+
+    def is_empty(self, x, y):
+        return self.get_grid_element(x, y) == '.'
+
+    def unit_count(self):
+        return sum(len(cells) for cells in self.active.values())
+
+    # units on every row and every column of the block
+    def units_per_line(self):
+        rows = [0] * (self.bottom_right[0] - self.top_left[0])
+        columns = [0] * (self.bottom_right[1] - self.top_left[1])
+        for cells in self.active.values():
+            for i, j in cells:
+                rows[i] += 1
+                columns[j] += 1
+        return rows, columns
+
+    # units of the block in the rectangle top_left, bottom_right of grid coordinates
+    def count_units(self, top_left, bottom_right):
+        (i0, j0), (i1, j1) = self.get_block_coordinates(*top_left), self.get_block_coordinates(*bottom_right)
+        return sum(1 for cells in self.active.values() for i, j in cells if i0 <= i < i1 and j0 <= j < j1)
+
+    # global coordinates of the units of a faction, in row-major order
+    def unit_positions(self, unit_type, region=None):
+        return [self.get_grid_coordinate(i, j) for i, j in sorted(self.active[unit_type])
+                if self.in_region(i, j, region)]
 
     
     def add_units(self, units):
@@ -94,15 +364,177 @@ class Block:
             if self.get_grid_element(x, y) != ".":
                 continue
 
-            if faction == "E":
-                self.grid[x - self.top_left[0]][y - self.top_left[1]] = EarthUnit(x, y)
-            elif faction == "F":
-                self.grid[x - self.top_left[0]][y - self.top_left[1]] = FireUnit(x, y)
-            elif faction == "W":
-                self.grid[x - self.top_left[0]][y - self.top_left[1]] = WaterUnit(x, y)
-            elif faction == "A":
-                self.grid[x - self.top_left[0]][y - self.top_left[1]] = AirUnit(x, y)
+            self.set_cell(x - self.top_left[0], y - self.top_left[1], UNIT_CLASSES[faction](x, y))
+
+
+    # an attack of a unit
+    def attack_unit(self, unit: Unit, outgoing_damage):
+        """
+        Handle the logic of a single unit attacking its potential targets.
+        For example, each unit might have 'directions' indicating adjacent cells.
+        If it's an Air unit, it may have extended range, etc.
+        Damage to cells of other blocks is appended to outgoing_damage[block_id].
+        """
+
+        if(not unit.can_attack()):
+            return
+
+        # attacks to a single coordinate in the grid
+        def attack_coord(x, y):
+            # If within the global grid
+            if 0 <= x < Utils.N and 0 <= y < Utils.N:
+                # If target cell is in the same block:
+                if self.is_coordinate_inside(x, y):
+                    local_unit = self.get_grid_element(x, y)
+                    # If target cell is not empty AND is a different faction
+                    if not (local_unit == "." or local_unit.unit_type == unit.unit_type):
+                        local_unit.damage_taken += unit.attack_power
+                        unit.attack_done = True
+                        return 2
+                    elif local_unit != ".":
+                        return 1
+                else:
+                    # Otherwise, resolve the target on the boundary copy and
+                    # queue the damage for the block that owns it
+                    enemy = self.get_grid_with_boundary_element(x, y)
+                    if not (enemy == "." or enemy == unit.unit_type):
+                        dest_block_id = Utils.coordinates_to_block_id(x, y)
+                        outgoing_damage[dest_block_id].append((x, y, unit.attack_power))
+                        unit.attack_done = True
+                        return 2
+                    elif enemy != ".":
+                        return 1 # The grid is full
+            return 0
+
+        # Attack each direction once; if Air unit, it may continue
+        for dx, dy in unit.directions:
+            nx, ny = unit.x + dx, unit.y + dy
+            did_attack = attack_coord(nx, ny)
+            if did_attack == 2 and unit.unit_type == 'F':
+                unit.enemies_attacked.append((nx, ny))
+
+            # Example: Air unit can "pierce" one more cell
+            if did_attack == 0 and unit.unit_type == 'A':
+                nx2, ny2 = nx + dx, ny + dy
+                attack_coord(nx2, ny2)
+
+    def attack(self, outgoing_damage):
+        for _, _, unit in self.occupied_cells():
+            self.attack_unit(unit, outgoing_damage)
+
+    # applies the damage neighbours batched for units of this block
+    def take_damage(self, incoming_damage):
+        for damages in incoming_damage.values():
+            for x, y, damage in damages:
+                # The attacker already checked the target on its boundary copy
+                self.get_grid_element(x, y).damage_taken += damage
+
+    # applies accumulated damage and removes dead units
+    def resolve(self):
+        for i, j, unit in self.occupied_cells():
+            # Example: Earth units may fortify
+            if unit.unit_type == 'E':
+                unit: EarthUnit
+                unit.fortify()
+
+            # Apply accumulated damage
+            unit.health -= unit.damage_taken
+            unit.damage_taken = 0
+
+            # Kill unit if health <= 0
+            if not unit.is_alive():
+                self.set_cell(i, j, '.')
+
+    def heal(self):
+        for _, _, unit in self.occupied_cells():
+            # If the unit hasn't attacked yet, it can heal
+            if not unit.attack_done:
+                unit.heal()
+            # Reset its attack state
+            unit.attack_done = False
+
+    # applies inferno to the fire units of a region
+    def apply_inferno(self, region=None):
+
+        # checks if the attacked enemy is dead
+        def is_inferno_available(unit: FireUnit):
+            for [row, column] in unit.enemies_attacked:
+                enemy = self.get_grid_with_boundary_element(row, column)
+                if enemy == '.':
+                    return True
+
+            return False
+
+        for i, j, unit in self.occupied_cells('F'):
+            if self.in_region(i, j, region):
+                if is_inferno_available(unit):
+                    unit.inferno()
+
+                unit.reset_enemies_attacked()
+
+    def reset_inferno(self):
+        for _, _, fire_unit in self.occupied_cells('F'):
+            fire_unit.reset_inferno()
+
+    def place_water_units(self, water_units):
+        for x, y in water_units:
+            grid_x, grid_y = self.get_block_coordinates(x, y)
+            self.set_cell(grid_x, grid_y, WaterUnit(x, y))
+
+    # takes the air units off the grid so they can be moved
+    def remove_air_units(self):
+        air_units = []
+        for i, j, air_unit in self.occupied_cells('A'):
+            air_units.append(air_unit)
+            self.set_cell(i, j, '.')
+        return air_units
+
+    # places a moved air unit, uniting it with the one already there
+    def place_air_unit(self, air_unit: AirUnit):
+        x, y = self.get_block_coordinates(air_unit.x, air_unit.y)
+        if self.grid[x][y] == '.':
+            self.set_cell(x, y, air_unit)
+        else:
+            self.grid[x][y].unite(air_unit)
+
+    # new positions of the air units of a region, (x, y) -> (new x, new y)
+    def air_moves(self, region=None):
+        return {(x, y): self.air_movement(x, y) for x, y in self.unit_positions('A', region)}
+
+    #calculates the new position of the air unit at (x, y)
+    def air_movement(self, x, y):
+        #calculates the number of enemies in range for a given point
+        def calculate_number_of_enemies(x, y):
+            cnt = 0
+            for dx, dy in AIR['DIRECTIONS']:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < Utils.N and 0 <= ny < Utils.N:
+                    enemy = self.get_grid_with_boundary_element(nx, ny)
+                    if enemy == '.':
+                        new_x, new_y = nx + dx, ny + dy
+                        if 0 <= new_x < Utils.N and 0 <= new_y < Utils.N:
+                            new_enemy = self.get_grid_with_boundary_element(new_x, new_y)
+                            if new_enemy != '.' and new_enemy != 'A':
+                                cnt += 1
+                    elif enemy != 'A':
+                        cnt += 1
+
+            return cnt
 
+        new_coordinates = (x, y)
+        max_enemies = calculate_number_of_enemies(x, y)
+        self.set_grid_with_boundary_element(x, y, '.')
+        for dx, dy in ADJACENT_CELLS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < Utils.N and 0 <= ny < Utils.N:
+                if self.get_grid_with_boundary_element(nx, ny) != '.':
+                    continue
+                number_of_enemies = calculate_number_of_enemies(nx, ny)
+                if number_of_enemies > max_enemies:
+                    new_coordinates = (nx, ny)
+                    max_enemies = number_of_enemies
+        self.set_grid_with_boundary_element(x, y, 'A')
+        return new_coordinates
 
     def __str__(self):
         return f"Block {self.id} ({self.top_left}, {self.bottom_right}) - {self.units} - Adjacent Blocks : {self.adjacent_blocks}"
@@ -0,0 +1,85 @@
+import os
+from array import array
+from mpi4py import MPI
+from utils import Utils
+
+# A checkpoint is the grid at a wave boundary: CHECKPOINT_MAGIC, N W T R and the
+# last wave played as int32, then (faction code, health, attack power) as int16
+# for every cell of the grid, row by row, as from pack_cells. Damage, attack
+# states, fire targets and the flooding and moving units are all cleared by the
+# end of a wave, so the cells are the whole state. The cells are laid out by
+# grid position and not by block, so any number of workers can restart from it.
+CHECKPOINT_MAGIC = b"EPCK"
+HEADER_SIZE = len(CHECKPOINT_MAGIC) + 5 * 4
+CELL_SIZE = 3 * 2
+
+
+def checkpoint_file(output_file):
+    return output_file + ".checkpoint"
+
+
+def block_view(block):
+    """
+    Subarray of the cells of a block in the grid of the checkpoint, in bytes.
+    """
+    view = MPI.BYTE.Create_subarray(
+        [Utils.N, Utils.N * CELL_SIZE],
+        [block.bottom_right[0] - block.top_left[0], (block.bottom_right[1] - block.top_left[1]) * CELL_SIZE],
+        [block.top_left[0], block.top_left[1] * CELL_SIZE])
+    view.Commit()
+    return view
+
+
+def write_checkpoint(comm, path, wave_idx=0, block=None):
+    """
+    Collective write of a checkpoint, every rank of comm calls it. Workers
+    write the cells of their block, the manager, without a block, the header.
+    The file is written next to path and renamed over it once complete, so a
+    crash while writing keeps the previous checkpoint.
+    """
+    temporary = path + ".tmp"
+    file = MPI.File.Open(comm, temporary, MPI.MODE_WRONLY | MPI.MODE_CREATE)
+    file.Set_size(HEADER_SIZE + Utils.N * Utils.N * CELL_SIZE)
+
+    if block is None:
+        file.Set_view(0, MPI.BYTE, MPI.BYTE)
+        header = CHECKPOINT_MAGIC + array('i', [Utils.N, Utils.W, Utils.T, Utils.R, wave_idx]).tobytes()
+        file.Write_at_all(0, [header, MPI.BYTE])
+    else:
+        view = block_view(block)
+        file.Set_view(HEADER_SIZE, MPI.BYTE, view)
+        file.Write_at_all(0, [block.pack_cells(block.top_left, block.bottom_right), MPI.BYTE])
+        view.Free()
+
+    file.Close()
+    if block is None:
+        os.replace(temporary, path)
+
+
+def read_checkpoint_header(path):
+    """
+    N, W, T, R and the last wave played of a checkpoint.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError(f"{path} is not a checkpoint")
+        return list(array('i', file.read(5 * 4)))
+
+
+def read_checkpoint(comm, path, block=None):
+    """
+    Collective read of a checkpoint, workers put the cells of their block
+    back, the manager takes part without reading anything.
+    """
+    file = MPI.File.Open(comm, path, MPI.MODE_RDONLY)
+    if block is None:
+        file.Set_view(0, MPI.BYTE, MPI.BYTE)
+        file.Read_at_all(0, [bytearray(0), MPI.BYTE])
+    else:
+        view = block_view(block)
+        file.Set_view(HEADER_SIZE, MPI.BYTE, view)
+        cells = bytearray(block.size[0] * block.size[1] * CELL_SIZE)
+        file.Read_at_all(0, [cells, MPI.BYTE])
+        view.Free()
+        block.unpack_cells(block.top_left, block.bottom_right, cells)
+    file.Close()
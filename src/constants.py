@@ -1,10 +1,28 @@
-EARTH = {'HEALTH': 18, 'ATTACK': 3, 'HEALING': 2}
-FIRE = {'HEALTH': 12, 'ATTACK': 4, 'HEALING': 1}
-WATER = {'HEALTH': 14, 'ATTACK': 3, 'HEALING': 2}
-AIR = {'HEALTH': 10, 'ATTACK': 2, 'HEALING': 2}
+EARTH = {'HEALTH': 18, 'ATTACK': 2, 'HEALING': 3,
+         'DIRECTIONS': [(0, -1), (0, 1), (-1, 0), (1, 0)]}
+FIRE = {'HEALTH': 12, 'ATTACK': 4, 'HEALING': 1,
+        'DIRECTIONS': [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]}
+WATER = {'HEALTH': 14, 'ATTACK': 3, 'HEALING': 2,
+         'DIRECTIONS': [(-1, -1), (1, 1), (-1, 1), (1, -1)]}
+AIR = {'HEALTH': 10, 'ATTACK': 2, 'HEALING': 2,
+       'DIRECTIONS': [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]}
+
+# Fire units keep gaining attack power through inferno up to this value
+FIRE_MAX_ATTACK = 6
+
+# Codes of the unit types in numeric messages and arrays, 0 is an empty cell
+UNIT_TYPES = ['.', 'E', 'F', 'W', 'A']
+
+# Offsets (dx, dy) of the adjacent block at each position, from top-left to left clockwise
+# [0, 1, 2]
+# [7, x, 3]
+# [6, 5, 4]
+NEIGHBOR_OFFSETS = [(-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0)]
+
+# Cells around a unit in the order flooding water and moving air units try them
+ADJACENT_CELLS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
 
 MESSAGES = {
     'BLOCKS_RECEIVED': {'message': True, 'tag': 1, 'dest': 0},
     'ACTIVE_TIME_DONE': {'message': True, 'tag': 2, 'dest': 0}
 }
-
@@ -0,0 +1,24 @@
+import argparse
+import math
+from utils import Utils
+from waves import write_binary_scenario
+
+parser = argparse.ArgumentParser(description="converts between the text and binary file formats")
+subparsers = parser.add_subparsers(dest="command", required=True)
+scenario = subparsers.add_parser("scenario", help="text scenario to the binary one main.py can memory map")
+scenario.add_argument("text_file")
+scenario.add_argument("binary_file")
+grid = subparsers.add_parser("grid", help="binary output of --output-format binary to the text grid")
+grid.add_argument("binary_file")
+grid.add_argument("text_file")
+args = parser.parse_args()
+
+if args.command == "scenario":
+    write_binary_scenario(args.text_file, args.binary_file)
+
+else:
+    with open(args.binary_file, "rb") as file:
+        cells = file.read().decode('ascii')
+    n = math.isqrt(len(cells))
+    with open(args.text_file, "w") as output:
+        Utils.print_grid([cells[x * n:(x + 1) * n] for x in range(n)], output)
@@ -0,0 +1,99 @@
+from mpi4py import MPI
+from utils import Utils
+from instrumentation import profile
+
+# With --halo-depth every worker plays the rounds on its block grown by a
+# margin of cells copied from the other blocks, so it needs no message until
+# the next exchange. Cells next to the edge of the grown block are wrong, as
+# their neighbors are missing, and the error spreads inward by the reach of a
+# round every round: an air unit decides its move from cells up to 3 away and
+# lands 1 away, then attacks 2 away, so a cell depends on cells up to
+# ROUND_REACH away at the start of the round. Flooding looks FLOOD_REACH away.
+# A margin of depth x ROUND_REACH + FLOOD_REACH keeps the block itself exact
+# for depth rounds and the flooding after them.
+ROUND_REACH = 6
+FLOOD_REACH = 2
+
+
+def margin(depth):
+    return depth * ROUND_REACH + FLOOD_REACH
+
+
+def grown_rectangle(block_id, cells):
+    """
+    Rectangle of a block grown by cells on every side, within the grid.
+    """
+    (x0, y0), (x1, y1) = Utils.block_rectangle(block_id, Utils.row_cuts, Utils.column_cuts)
+    return (max(0, x0 - cells), max(0, y0 - cells)), (min(Utils.N, x1 + cells), min(Utils.N, y1 + cells))
+
+
+class DeepHalo:
+    """
+    Plays a wave of a worker in groups of depth rounds. Before every group the
+    workers swap the round state of the cells in each other's margins with one
+    Alltoallv on worker_comm, whose rank k is block k + 1, and each builds its
+    grown block from it. After the group the block takes its own cells back.
+    Only the NumPy blocks have the round state in arrays, so it needs --grid
+    arrays.
+    """
+
+    def __init__(self, worker_comm, depth):
+        self.comm = worker_comm
+        self.depth = depth
+        self.margin = margin(depth)
+
+    def exchange(self, block):
+        """
+        The grown block of block, filled from block and the other workers.
+        """
+        size = self.comm.Get_size()
+        own = (block.top_left, block.bottom_right)
+        grown = grown_rectangle(block.id, self.margin)
+
+        send_parts, send_counts, receive_counts = [], [0] * size, [0] * size
+        incoming = {}
+        for rank in range(size):
+            if rank + 1 == block.id:
+                continue
+            outgoing = Utils.overlap(own, grown_rectangle(rank + 1, self.margin))
+            if outgoing:
+                send_parts.append(block.pack_round_cells(*outgoing))
+                send_counts[rank] = len(send_parts[-1]) // 2
+            incoming[rank] = Utils.overlap(grown, Utils.block_rectangle(rank + 1, Utils.row_cuts, Utils.column_cuts))
+            if incoming[rank]:
+                (x0, y0), (x1, y1) = incoming[rank]
+                receive_counts[rank] = (x1 - x0) * (y1 - y0) * 4
+
+        send_displacements = [sum(send_counts[:rank]) for rank in range(size)]
+        receive_displacements = [sum(receive_counts[:rank]) for rank in range(size)]
+        received = bytearray(2 * sum(receive_counts))
+        profile.sent('alltoallv', 2 * sum(send_counts))
+        with profile.blocking():
+            self.comm.Alltoallv([bytearray(b''.join(send_parts)), (send_counts, send_displacements), MPI.SHORT],
+                                [received, (receive_counts, receive_displacements), MPI.SHORT])
+
+        (x0, y0), (x1, y1) = grown
+        grown_block = type(block)({"E": [], "F": [], "W": [], "A": []}, grown[0], grown[1], block.id, [],
+                                  (y1 - y0, x1 - x0))
+        grown_block.unpack_round_cells(*own, block.pack_round_cells(*own))
+        for rank, cells in incoming.items():
+            if cells:
+                start = 2 * receive_displacements[rank]
+                grown_block.unpack_round_cells(*cells, received[start:start + 2 * receive_counts[rank]])
+        return grown_block
+
+    def play_wave(self, block):
+        """
+        All the rounds of a wave and the flooding after them. A wave without
+        rounds still exchanges once, for the flooding.
+        """
+        for start in range(0, max(Utils.R, 1), self.depth):
+            with profile.phase('boundary exchange', block.unit_count() if profile.enabled else 0):
+                grown_block = self.exchange(block)
+            with profile.phase('deep rounds', grown_block.unit_count() if profile.enabled else 0):
+                for _ in range(min(self.depth, Utils.R - start)):
+                    grown_block.play_round()
+                if start + self.depth >= Utils.R:
+                    grown_block.end_wave()
+            own = (block.top_left, block.bottom_right)
+            block.unpack_round_cells(*own, grown_block.pack_round_cells(*own))
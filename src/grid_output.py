@@ -0,0 +1,69 @@
+from mpi4py import MPI
+from utils import Utils
+
+# The final grid is written by all the ranks at once with collective MPI-IO.
+# Both output formats have rows of a fixed length, so the place of every cell
+# in the file is known: the text grid has two characters per cell and a
+# newline per row, followed by a blank line, the binary one a byte per cell.
+
+
+def cell_width(output_format):
+    return 2 if output_format == "text" else 1
+
+
+def row_length(output_format):
+    return Utils.N * cell_width(output_format) + (1 if output_format == "text" else 0)
+
+
+def file_size(output_format):
+    return Utils.N * row_length(output_format) + (1 if output_format == "text" else 0)
+
+
+def layout_cells(cells, width, output_format, last_column):
+    """
+    Cells of a block, one byte per cell row by row as from pack_grid, as they
+    are laid out in the output file. Blocks on the last column of the grid
+    end their rows with the newline.
+    """
+    if output_format != "text":
+        return cells
+    line_end = b'\n' if last_column else b''
+    rows = []
+    for k in range(0, len(cells), width):
+        row = bytearray(2 * width)
+        row[0::2] = cells[k:k + width]
+        row[1::2] = b' ' * width
+        rows.append(bytes(row) + line_end)
+    return b''.join(rows)
+
+
+def write_grid(comm, output_file, output_format, block=None):
+    """
+    Collective write of the final grid, every rank of comm calls it. A block
+    sees the file through a subarray view of its rectangle, so its rows are
+    written with one Write_at_all. The manager, without a block, writes the
+    blank line that ends the text grid.
+    """
+    file = MPI.File.Open(comm, output_file, MPI.MODE_WRONLY | MPI.MODE_CREATE)
+    # an older and longer output would keep its tail otherwise
+    file.Set_size(file_size(output_format))
+
+    # Set_view is collective too, the manager sees the file as plain bytes
+    if block is None:
+        file.Set_view(0, MPI.BYTE, MPI.BYTE)
+        end = b'\n' if output_format == "text" else b''
+        file.Write_at_all(Utils.N * row_length(output_format), [end, MPI.BYTE])
+    else:
+        width = block.bottom_right[1] - block.top_left[1]
+        last_column = block.bottom_right[1] == Utils.N
+        cells = layout_cells(block.pack_grid(), width, output_format, last_column)
+        columns = width * cell_width(output_format) + (1 if output_format == "text" and last_column else 0)
+        view = MPI.BYTE.Create_subarray([Utils.N, row_length(output_format)],
+                                        [block.bottom_right[0] - block.top_left[0], columns],
+                                        [block.top_left[0], block.top_left[1] * cell_width(output_format)])
+        view.Commit()
+        file.Set_view(0, MPI.BYTE, view)
+        file.Write_at_all(0, [cells, MPI.BYTE])
+        view.Free()
+
+    file.Close()
@@ -0,0 +1,71 @@
+from array import array
+
+# Boundary messages of --halo delta start with one of these bytes. A FULL
+# message is the whole strip, one byte per cell as from pack_boundary, a DELTA
+# one the indices of the cells that changed since the last strip sent to that
+# neighbor, then their new bytes. Indices are uint16 when the strip is short
+# enough, uint32 otherwise, both sides know its length. The receiver's ring
+# only changes through these messages, so it always holds the last strip.
+FULL = 0
+DELTA = 1
+
+
+def index_typecode(length):
+    return 'H' if length <= 1 << 16 else 'I'
+
+
+def message_size(length):
+    """
+    Largest boundary message for a strip of length cells, a delta is only
+    sent when it is shorter than the full strip.
+    """
+    return 1 + length
+
+
+class DeltaHalo:
+    """
+    Last strip sent to every neighbor, and the bytes sent against the bytes
+    the full strips would have taken, for the report at the end of the run.
+    """
+
+    def __init__(self):
+        self.sent = {}
+        self.exchanges = 0
+        self.bytes = 0
+        self.full_bytes = 0
+
+    # a new block starts with an empty ring on every side
+    def reset(self):
+        self.sent.clear()
+
+    def encode(self, block_id, strip):
+        previous = self.sent.get(block_id, b'.' * len(strip))
+        self.sent[block_id] = strip
+        changed = [k for k, (old, new) in enumerate(zip(previous, strip)) if old != new]
+
+        typecode = index_typecode(len(strip))
+        if len(changed) * (array(typecode).itemsize + 1) < len(strip):
+            message = (bytes([DELTA]) + array(typecode, changed).tobytes()
+                       + bytes(strip[k] for k in changed))
+        else:
+            message = bytes([FULL]) + strip
+
+        self.exchanges += 1
+        self.bytes += len(message)
+        self.full_bytes += len(strip)
+        return message
+
+
+def decode(block, message, position):
+    """
+    Applies a boundary message of --halo delta to the ring of block.
+    """
+    if message[0] == FULL:
+        block.unpack_boundary(message[1:], position)
+        return
+    rows, columns = block.boundary_shape(position)
+    typecode = index_typecode(rows * columns)
+    count = (len(message) - 1) // (array(typecode).itemsize + 1)
+    indices = array(typecode)
+    indices.frombytes(message[1:1 + count * indices.itemsize])
+    block.patch_boundary(position, indices, message[1 + count * indices.itemsize:])
@@ -0,0 +1,166 @@
+import csv
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Counters of every phase, see Profile
+PHASE_FIELDS = ['calls', 'seconds', 'blocked_seconds', 'messages', 'bytes', 'units']
+
+
+def peak_memory_kb():
+    """
+    Peak resident memory of the process in kilobytes. ru_maxrss is in
+    kilobytes on Linux but in bytes on macOS.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Profile:
+    """
+    Opt-in counters of one rank for --profile. Time is counted per phase:
+    wall time, the part of it spent blocked in receives, waits and barriers,
+    the messages and bytes sent and the units on the block when the phase
+    started. Messages are counted per tag too. Phases can nest, the time of an
+    inner phase is also part of the outer one, and what happens outside any
+    phase goes to 'other'. While disabled every hook returns right away.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started = 0.0
+        self.stack = []
+        self.phases = {}
+        self.tags = {}
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.perf_counter()
+
+    def entry(self, name):
+        if name not in self.phases:
+            self.phases[name] = dict.fromkeys(PHASE_FIELDS, 0)
+        return self.phases[name]
+
+    def current(self):
+        return self.entry(self.stack[-1][0] if self.stack else 'other')
+
+    def start(self, name, units=0):
+        if self.enabled:
+            self.entry(name)['units'] += units
+            self.stack.append((name, time.perf_counter()))
+
+    def stop(self):
+        if self.enabled and self.stack:
+            name, start = self.stack.pop()
+            entry = self.entry(name)
+            entry['calls'] += 1
+            entry['seconds'] += time.perf_counter() - start
+
+    @contextmanager
+    def phase(self, name, units=0):
+        self.start(name, units)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed(self, name):
+        """
+        Decorator that runs a method as a phase.
+        """
+        def decorator(method):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return method(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def sent(self, tag, size):
+        if self.enabled:
+            entry = self.current()
+            entry['messages'] += 1
+            entry['bytes'] += size
+            counts = self.tags.setdefault(str(tag), {'messages': 0, 'bytes': 0})
+            counts['messages'] += 1
+            counts['bytes'] += size
+
+    @contextmanager
+    def blocking(self):
+        """
+        Time of a receive, wait or barrier, counted as blocked in the current phase.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current()['blocked_seconds'] += time.perf_counter() - start
+
+    def report(self, rank):
+        """
+        Counters of the rank, with the seconds since the profile was enabled
+        and the peak resident memory of the process in kilobytes.
+        """
+        return {'rank': rank, 'seconds': time.perf_counter() - self.started,
+                'peak_memory_kb': peak_memory_kb(),
+                'phases': self.phases, 'tags': self.tags}
+
+
+# The profile of this process, shared by every module that is instrumented
+profile = Profile()
+
+
+def merge(reports):
+    """
+    Sums the phases and tags of the reports of all ranks, the run lasts as long
+    as its slowest rank.
+    """
+    phases, tags = {}, {}
+    for report in reports:
+        for name, counts in report['phases'].items():
+            total = phases.setdefault(name, dict.fromkeys(PHASE_FIELDS, 0))
+            for field in PHASE_FIELDS:
+                total[field] += counts[field]
+        for tag, counts in report['tags'].items():
+            total = tags.setdefault(tag, {'messages': 0, 'bytes': 0})
+            total['messages'] += counts['messages']
+            total['bytes'] += counts['bytes']
+    return {'seconds': max(report['seconds'] for report in reports),
+            'peak_memory_kb': max(report['peak_memory_kb'] for report in reports),
+            'phases': phases, 'tags': tags}
+
+
+def write_report(comm, path):
+    """
+    Collects the profiles of all ranks on rank 0, which writes them with their
+    totals: CSV with one row per rank and phase or tag when path ends in
+    .csv, the peak memory of a rank in its bytes column, JSON otherwise.
+    Called by every rank once the run is over.
+    """
+    reports = comm.gather(profile.report(comm.Get_rank()), root=0)
+    if comm.Get_rank() != 0:
+        return
+
+    total = merge(reports)
+    if not path.endswith(".csv"):
+        with open(path, "w") as file:
+            json.dump({'ranks': reports, 'total': total}, file, indent=1)
+        return
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(['rank', 'kind', 'name'] + PHASE_FIELDS)
+        for rank, report in [(report['rank'], report) for report in reports] + [('total', total)]:
+            writer.writerow([rank, 'run', 'wall', 1, report['seconds'], '', '', '', ''])
+            writer.writerow([rank, 'run', 'peak memory', '', '', '', '', report['peak_memory_kb'] * 1024, ''])
+            for name, counts in report['phases'].items():
+                writer.writerow([rank, 'phase', name] + [counts[field] for field in PHASE_FIELDS])
+            for tag, counts in report['tags'].items():
+                writer.writerow([rank, 'tag', tag, '', '', '', counts['messages'], counts['bytes'], ''])
@@ -1,29 +1,80 @@
-from mpi4py import MPI
-import sys
-from manager import Manager
-from worker import Worker
+import argparse
 
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-size = comm.Get_size()
+parser = argparse.ArgumentParser()
+parser.add_argument("input_file", nargs="?", default="input.txt")
+parser.add_argument("output_file", nargs="?", default="output.txt")
+parser.add_argument("--engine", choices=["mpi", "serial", "shared"], default="mpi",
+                    help="run on MPI ranks, in a single process or in a pool of processes sharing the grid")
+parser.add_argument("--workers", type=int, default=4,
+                    help="number of blocks for --engine shared")
+parser.add_argument("--decomposition", choices=["equal", "balanced"], default="equal",
+                    help="cut the grid into blocks of equal area or with balanced wave units")
+parser.add_argument("--rebalance", type=float, default=0, metavar="THRESHOLD",
+                    help="repartition between waves when the load imbalance is above THRESHOLD (MPI engine)")
+parser.add_argument("--grid", choices=["objects", "arrays"], default="objects",
+                    help="block representation: lists of Unit objects or NumPy arrays")
+parser.add_argument("--schedule", choices=["manager", "autonomous"], default="manager",
+                    help="who drives the round phases: the manager's states or the workers themselves")
+parser.add_argument("--output-format", choices=["text", "binary"], default="text",
+                    help="text grid, or one byte per cell written by every block into the output file")
+parser.add_argument("--checkpoint", type=int, default=0, metavar="WAVES",
+                    help="write the grid to OUTPUT_FILE.checkpoint every WAVES waves (MPI engine)")
+parser.add_argument("--restart", metavar="CHECKPOINT",
+                    help="continue from a checkpoint, with any number of workers (MPI engine)")
+parser.add_argument("--halo", choices=["full", "delta"], default="full",
+                    help="send the whole boundary strips, or only the cells that changed since the last exchange")
+parser.add_argument("--halo-depth", type=int, default=0, metavar="ROUNDS",
+                    help="exchange margins wide enough to play ROUNDS rounds without messages "
+                         "(--grid arrays --schedule autonomous)")
+parser.add_argument("--profile", metavar="REPORT",
+                    help="time every phase on every rank and write the report to REPORT, CSV when it ends "
+                         "in .csv and JSON otherwise (MPI engine)")
+args = parser.parse_args()
+if args.halo_depth and (args.grid != "arrays" or args.schedule != "autonomous"):
+    parser.error("--halo-depth needs --grid arrays and --schedule autonomous")
 
-if(len(sys.argv) < 2):
-    input_file = "input.txt"
-    output_file = "output.txt"
+if args.engine == "serial":
+    # No MPI is imported, so it runs as a plain python process
+    from serial_engine import SerialEngine
+    SerialEngine(args.input_file, args.output_file, args.output_format).run()
 
-else:
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-
-manager = Manager(input_file, output_file, size - 1)
-workers = [Worker(i + 1) for i in range(size - 1)]
-
-if rank == 0:
-    manager.run()
+elif args.engine == "shared":
+    from shared_engine import SharedMemoryEngine
+    SharedMemoryEngine(args.input_file, args.output_file, args.workers, args.decomposition,
+                       args.output_format).run()
 
 else:
-    workers[rank - 1].run()
+    from mpi4py import MPI
+    from utils import Utils
+    from manager import Manager
+    from worker import Worker
+    from instrumentation import profile, write_report
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+    Utils.set_worker_count(size - 1)
+    if args.profile:
+        profile.enable()
 
+    # Only rank 0 reads the scenario and builds the manager, a worker only
+    # builds itself and gets the rest from the start-up collectives
+    if rank == 0:
+        manager = Manager(args.input_file, args.output_file, size - 1, grid=args.grid,
+                          decomposition=args.decomposition, rebalance=args.rebalance,
+                          output_format=args.output_format, checkpoint=args.checkpoint, restart=args.restart,
+                          halo=args.halo, halo_depth=args.halo_depth)
+        if args.schedule == "autonomous":
+            manager.run_autonomous()
+        else:
+            manager.run()
 
+    else:
+        worker = Worker(rank)
+        if args.schedule == "autonomous":
+            worker.run_autonomous()
+        else:
+            worker.run()
 
-    
+    if args.profile:
+        write_report(comm, args.profile)
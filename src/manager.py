@@ -1,261 +1,393 @@
-import re
-from block import Block
+import sys
+import time
+from array import array
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from block import block_class, generate_blocks, calculate_adjacent_blocks, GEOMETRY_SIZE
 from utils import Utils
 from mpi4py import MPI
-from constants import MESSAGES
+from constants import MESSAGES, UNIT_TYPES
+from transport import TYPECODE, send_ints, recv_ints, scatter_ints, scatter_records
+from waves import open_waves, read_header
+from grid_output import write_grid
+from checkpoint import checkpoint_file, write_checkpoint, read_checkpoint_header, read_checkpoint
+from instrumentation import profile
 
 comm = MPI.COMM_WORLD
 
 class Manager:
-    def __init__(self, input_file, output_file, worker_count):
+    def __init__(self, input_file, output_file, worker_count, grid="objects", decomposition="equal", rebalance=0,
+                 output_format="text", checkpoint=0, restart=None, halo="full", halo_depth=0):
         self.input_file = input_file
         self.output_file = output_file
+        # "binary" has the workers write their blocks straight into the output file
+        self.output_format = output_format
         self.worker_count = worker_count 
+        self.grid = grid
+        self.decomposition = decomposition
+        # repartition between waves when the expected load imbalance is above this, 0 never does
+        self.rebalance_threshold = rebalance
+        # a checkpoint is written every this many waves, 0 never does, and the
+        # run starts from the checkpoint file restart when it is given
+        self.checkpoint_every = checkpoint
+        self.restart_file = restart
+        self.first_wave = 1
+        # "delta" sends only the boundary cells that changed since the last exchange
+        self.halo = halo
+        # rounds the autonomous workers play between exchanges of deep halos, 0 for the 3 cell ring
+        self.halo_depth = halo_depth
+        self.block_class = block_class(grid)
 
-        with open(input_file, "r") as file:
-            self.lines = file.readlines()
-        
-        try:
-            self.output = open(output_file, "w")
-        except:
-            self.output = open("output.txt", "x")
-
-    
-    # Parse wave data from the input file
-    def parse_wave_data(self, lines):
-        wave_data = {}
-        wave_index = 0
-        for line in lines[1:]:
-            line = line.strip()
-            if line.startswith("Wave"):
-                wave_index += 1
-                wave_data[wave_index] = {"E": [], "F": [], "W": [], "A": []}
-            elif line.startswith(("E:", "F:", "W:", "A:")):
-                faction, coordinates = line.split(":")
-                coords = [
-                    tuple(map(int, coord.split()))
-                    for coord in re.findall(r"\d+ \d+", coordinates)
-                ]
-                wave_data[wave_index][faction] = coords
-        return wave_data
-
-    # Generate blocks and block ids
-    def generate_blocks(self, block_sizes):
-        blocks = []
-        block_ids = []
-        block_id = 1
-
-        top_left = (0, 0)
-        for i in range(len(block_sizes)):
-            block_top_left = top_left
-            block_ids.append([])
-            for j in range(len(block_sizes[i])):
-                width, height = block_sizes[i][j]
-                bottom_right = (
-                    block_top_left[0] + height,
-                    block_top_left[1] + width
-                )
-                blocks.append(
-                    Block(
-                        {"E": [], "F": [], "W": [], "A": []},
-                        block_top_left,
-                        bottom_right,
-                        block_id,
-                        [],
-                        block_sizes[i][j]
-                    )
-                )
-                block_ids[i].append(block_id)
-                block_id += 1
-                block_top_left = (block_top_left[0], block_top_left[1] + width)
-            top_left = (top_left[0] + block_sizes[i][0][1], top_left[1])
-
-        return blocks, block_ids
-
-    # Calculate adjacent blocks for each block    
-    def calculate_adjacent_blocks(self, block_ids, blocks):
-        for i in range(len(block_ids)):
-            for j in range(len(block_ids[i])):
-                adjacent_blocks = []
-                # from top-left to left clockwise [0, 1, 2]
-                #                                 [7, x, 3]
-                #                                 [6, 5, 4]
-                dx = [-1,  0,  1,  1,  1,  0, -1, -1]
-                dy = [-1, -1, -1,  0,  1,  1,  1,  0]  
-                for k in range(8):
-                    y = i + dy[k]
-                    x = j + dx[k]
-                    if 0 <= y < len(block_ids) and 0 <= x < len(block_ids[i]):
-                        adjacent_blocks.append({
-                            'block_id': block_ids[y][x],
-                            'position': k,
-                            'relative_position': (dx[k], dy[k])
-                        })
-                blocks[block_ids[i][j] - 1].adjacent_blocks = adjacent_blocks
     
-    # Send blocks to workers
-    def send_blocks(self):
+    # Send blocks to workers with one Scatter of their geometries, the manager's part is empty
+    def scatter_blocks(self):
+        geometries = [0] * GEOMETRY_SIZE
         for b in self.blocks:
-            comm.send({'state': 1}, dest=b.id, tag=10)
-            comm.send(b, dest=b.id, tag=1)
-
-    # Send units to workers at the beginning of each wave
-    def send_units(self, blocks):
-        for i in range(len(blocks)):
-            comm.send({'state': 20}, dest=i + 1, tag=10)
-            comm.send(blocks[i]['units'], dest=i + 1, tag=2)
+            geometries.extend(b.pack_geometry())
+        scatter_ints(comm, geometries, GEOMETRY_SIZE)
+
+    # Send the units of a wave to all workers with one Scatterv, then start on the next wave
+    @profile.timed('wave injection')
+    def inject_wave(self, wave_idx, set_state=True):
+        _, (records, counts) = self.prepared_wave(wave_idx)
+        if set_state:
+            for rank in range(1, self.worker_count + 1):
+                self.send_state(20, rank)
+        scatter_records(comm, records, counts, 3)
+        if wave_idx < Utils.W:
+            self.prefetch(wave_idx + 1)
+
+    def prefetch(self, wave_idx):
+        """
+        Parses and splits the units of wave_idx in a background thread, while the
+        workers play the wave before it. Only this thread reads the waves once
+        the run has started. The block lookup of the current cuts goes with it,
+        a repartition before the wave is sent replaces it with new tables.
+        """
+        lookup = (Utils.block_row_of, Utils.block_column_of)
+        self.prefetched = (wave_idx, self.executor.submit(self.prepare_wave, wave_idx, lookup))
+
+    def prepare_wave(self, wave_idx, lookup):
+        wave = self.waves.wave(wave_idx)
+        return wave, lookup, self.partition_units(wave, lookup)
+
+    def prepared_wave(self, wave_idx):
+        """
+        Units of wave_idx and their records split by block under the current cuts.
+        """
+        if self.prefetched is None or self.prefetched[0] != wave_idx:
+            self.prefetch(wave_idx)
+        try:
+            wave, lookup, partition = self.prefetched[1].result()
+        except ValueError as error:
+            # a malformed wave, the workers would wait for it forever
+            print(f"wave {wave_idx}: {error}", file=sys.stderr)
+            comm.Abort(1)
+        if lookup[0] is not Utils.block_row_of or lookup[1] is not Utils.block_column_of:
+            partition = self.partition_units(wave, (Utils.block_row_of, Utils.block_column_of))
+        return wave, partition
+
+    def partition_units(self, wave, lookup):
+        """
+        Flat (faction code, x, y) records of the units of a wave sorted by rank,
+        and the number of ints of every rank, the manager gets none. The block
+        ids of all the units are looked up at once and a stable sort groups
+        them, so every block keeps the units in the order of the wave. Without
+        NumPy the units are split one by one.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            return self.partition_units_by_unit(wave, lookup)
+
+        block_row_of, block_column_of = lookup
+        codes = np.concatenate([np.full(len(wave[faction]), UNIT_TYPES.index(faction), dtype=np.int16)
+                                for faction in wave])
+        cells = np.fromiter(chain.from_iterable(chain.from_iterable(wave.values())), dtype=np.int64,
+                            count=2 * len(codes)).reshape(-1, 2)
+        inside = ((cells >= 0) & (cells < Utils.N)).all(axis=1)
+        codes, cells = codes[inside], cells[inside]
+
+        block_ids = (np.asarray(block_row_of)[cells[:, 0]] * Utils.block_columns
+                     + np.asarray(block_column_of)[cells[:, 1]] + 1)
+        order = np.argsort(block_ids, kind='stable')
+        records = np.column_stack((codes, cells.astype(np.int16)))[order].ravel()
+        counts = 3 * np.bincount(block_ids, minlength=self.worker_count + 1)
+        return records, counts.tolist()
+
+    # the same split unit by unit, for the objects grid without NumPy
+    def partition_units_by_unit(self, wave, lookup):
+        block_row_of, block_column_of = lookup
+        parts = [array(TYPECODE) for _ in range(self.worker_count + 1)]
+        for faction in wave:
+            code = UNIT_TYPES.index(faction)
+            for x, y in wave[faction]:
+                if 0 <= x < Utils.N and 0 <= y < Utils.N:
+                    parts[block_row_of[x] * Utils.block_columns + block_column_of[y] + 1].extend((code, x, y))
+        return array(TYPECODE, chain.from_iterable(parts)), [len(part) for part in parts]
     
+    # State messages are [state, current_worker_group]
+    def send_state(self, state, rank, worker_group=-1):
+        send_ints(comm, [state, worker_group], dest=rank, tag=10)
+
     # Set states of workers
+    @profile.timed('states')
     def set_states(self, states, workers, worker_group):
         for rank in range(1, self.worker_count + 1):
             if workers[rank - 1]:
-                comm.send({'state': states[0], 'current_worker_group': worker_group}, dest=rank, tag=10)
+                self.send_state(states[0], rank, worker_group)
             else:
-                comm.send({'state': states[1], 'current_worker_group': worker_group}, dest=rank, tag=10)
+                self.send_state(states[1], rank, worker_group)
+
+    # Wait for the active workers to finish their part of a checkerboard pass
+    @profile.timed('wait active workers')
+    def wait_active_workers(self, workers):
+        for rank in range(1, self.worker_count + 1):
+            if workers[rank - 1]:
+                recv_ints(comm, 1, source=rank, tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
 
     # Set current workers use different states for neighbor blocks to avoid deadlocks
     def set_current_workers(self, x, y):
-        sqr_of_worker = int(self.worker_count ** 0.5)
         if x == -1 and y == -1:
             return [True] * self.worker_count
 
         current_workers = [False] * self.worker_count
-        for i in range(sqr_of_worker):
-            for j in range(sqr_of_worker):
+        for i in range(Utils.block_rows):
+            for j in range(Utils.block_columns):
                 if (i % 2 == x) and (j % 2 == y):
-                    current_workers[i * sqr_of_worker + j] = True
+                    current_workers[i * Utils.block_columns + j] = True
         return current_workers
     
-    # Gather grids from workers and print the final grid
-    def gather_grids_and_print(self):
-        finalGrid = [['.' for _ in range(Utils.N)] for _ in range(Utils.N)]
-        for rank in range(1, self.worker_count + 1):
-            comm.send({'state': 13}, dest=rank, tag=10)
-            block = comm.recv(source=rank, tag=10)
-            for row_idx in range(block.top_left[0], block.bottom_right[0]):
-                for col_idx in range(block.top_left[1], block.bottom_right[1]):
-                    finalGrid[row_idx][col_idx] = str(
-                        block.grid[row_idx - block.top_left[0]][col_idx - block.top_left[1]]
-                    )
-        for row in finalGrid:
-            for cell in row:
-                print(cell.ljust(2, ' '), end="", file=self.output)
-            print(file=self.output)
-        print(file=self.output)
-
-    def run(self):
-        Utils.parse_general_info(self.lines)
+    # Workers write their blocks into the output file, the manager only joins the collective write
+    @profile.timed('gather')
+    def gather_grids_and_print(self, request_blocks=True):
+        if request_blocks:
+            for rank in range(1, self.worker_count + 1):
+                self.send_state(13, rank)
+        write_grid(comm, self.output_file, self.output_format)
+        if self.halo == "delta":
+            self.report_halo()
+
+    def report_halo(self):
+        """
+        Boundary bytes of all the workers per round with --halo delta, against
+        the full strips.
+        """
+        totals = array('d', [0, 0, 0])
+        comm.Reduce([array('d', [0, 0, 0]), MPI.DOUBLE], [totals, MPI.DOUBLE], op=MPI.SUM, root=0)
+        exchanges, sent, full = totals
+        rounds = (Utils.W - self.first_wave + 1) * Utils.R
+        print(f"halo exchange: {sent / rounds:.0f} bytes per round, full strips {full / rounds:.0f} bytes per round "
+              f"({sent / max(full, 1):.1%}), {exchanges:.0f} boundary messages")
+
+    @profile.timed('rebalance')
+    def rebalance(self, wave_idx):
+        """
+        Wave boundary after wave_idx. The workers report their phase times, the
+        units on their blocks and the units on every row and column of the grid,
+        and the load of the next wave is the units on the grid plus the ones it
+        brings. When its imbalance is above the threshold the workers count
+        their units under the cuts that balance the rows and columns, and move
+        to the new blocks if these lower it.
+        """
+        phase_times = array('d', bytes(8 * (self.worker_count + 1)))
+        comm.Gather([array('d', [0.0]), MPI.DOUBLE], [phase_times, MPI.DOUBLE], root=0)
+        lines = array('i', bytes(2 * Utils.N * array('i').itemsize))
+        comm.Reduce([array('i', bytes(2 * Utils.N * array('i').itemsize)), MPI.INT], [lines, MPI.INT],
+                    op=MPI.SUM, root=0)
+        units_on_blocks = array('i', bytes((self.worker_count + 1) * array('i').itemsize))
+        comm.Gather([array('i', [0]), MPI.INT], [units_on_blocks, MPI.INT], root=0)
+
+        wave, (_, counts) = self.prepared_wave(wave_idx + 1)
+        wave_units = list(Utils.wave_units([wave]))
+        load = [units_on_blocks[rank] + counts[rank] // 3 for rank in range(1, self.worker_count + 1)]
+        imbalance = Utils.imbalance(load)
+        print(f"wave {wave_idx}: phase time per worker {min(phase_times[1:]):.3f}-{max(phase_times[1:]):.3f} s, "
+              f"next wave units per worker {min(load)}-{max(load)}, imbalance {imbalance:.2f}")
+
+        candidate = [0] * (Utils.block_rows + Utils.block_columns + 3)
+        if imbalance > self.rebalance_threshold:
+            units_per_row, units_per_column = lines[:Utils.N].tolist(), lines[Utils.N:].tolist()
+            for x, y in wave_units:
+                units_per_row[x] += 1
+                units_per_column[y] += 1
+            row_cuts, column_cuts = Utils.cuts_for_lines(units_per_row, units_per_column)
+            candidate = [1] + row_cuts + column_cuts
+        comm.Bcast([array('i', candidate), MPI.INT], root=0)
+        if not candidate[0]:
+            return
+
+        new_load = array('i', bytes(self.worker_count * array('i').itemsize))
+        comm.Reduce([array('i', bytes(self.worker_count * array('i').itemsize)), MPI.INT], [new_load, MPI.INT],
+                    op=MPI.SUM, root=0)
+        new_imbalance = Utils.imbalance([on_block + from_wave for on_block, from_wave
+                                         in zip(new_load, Utils.units_per_block(wave_units, row_cuts, column_cuts))])
+        decision = [int(new_imbalance < imbalance)]
+        comm.Bcast([array('i', decision), MPI.INT], root=0)
+
+        if decision[0]:
+            start = time.perf_counter()
+            moved_cells = self.migrate(row_cuts, column_cuts)
+            print(f"  repartitioned: imbalance {imbalance:.2f} -> {new_imbalance:.2f}, {moved_cells} cells "
+                  f"({moved_cells * 6} bytes) moved in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def migrate(self, row_cuts, column_cuts):
+        """
+        Sends the workers their blocks under the new cuts, then joins the
+        Alltoallv that moves the cells between them. Returns the number of
+        cells that changed owner.
+        """
+        old_rectangles = [(block.top_left, block.bottom_right) for block in self.blocks]
+        Utils.row_cuts, Utils.column_cuts = row_cuts, column_cuts
+        Utils.build_block_lookup()
+        self.blocks, self.block_ids = generate_blocks(Utils.block_sizes_from_cuts(), self.block_class)
+        calculate_adjacent_blocks(self.block_ids, self.blocks)
+        for b in self.blocks:
+            send_ints(comm, b.pack_geometry(), dest=b.id, tag=1)
+
+        nothing = [0] * (self.worker_count + 1)
+        comm.Alltoallv([bytearray(0), (nothing, nothing), MPI.SHORT], [bytearray(0), (nothing, nothing), MPI.SHORT])
+        comm.Barrier()
+
+        moved_cells = 0
+        for old_id, old_rectangle in enumerate(old_rectangles, start=1):
+            for block in self.blocks:
+                overlap = Utils.overlap(old_rectangle, (block.top_left, block.bottom_right))
+                if overlap and block.id != old_id:
+                    moved_cells += (overlap[1][0] - overlap[0][0]) * (overlap[1][1] - overlap[0][1])
+        return moved_cells
+
+    def checkpoint_due(self, wave_idx):
+        return self.checkpoint_every and wave_idx % self.checkpoint_every == 0 and wave_idx < Utils.W
+
+    @profile.timed('checkpoint')
+    def checkpoint(self, wave_idx):
+        """
+        The workers write their blocks as they are at the end of wave_idx, the
+        manager the header, see checkpoint.py.
+        """
+        start = time.perf_counter()
+        write_checkpoint(comm, checkpoint_file(self.output_file), wave_idx)
+        print(f"wave {wave_idx}: checkpoint written to {checkpoint_file(self.output_file)} "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    @profile.timed('setup')
+    def setup(self):
+        Utils.parse_general_info(read_header(self.input_file))
+        # Waves are parsed one at a time when they are sent
+        self.waves = open_waves(self.input_file)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetched = None
+
+        # Checked before the broadcast, the workers would wait for it forever
+        try:
+            if self.restart_file:
+                n, _, _, _, last_wave = read_checkpoint_header(self.restart_file)
+                if n != Utils.N:
+                    raise ValueError(f"{self.restart_file} is a checkpoint of a {n}x{n} grid, "
+                                     f"not of the {Utils.N}x{Utils.N} grid of {self.input_file}")
+                self.first_wave = last_wave + 1
+                print(f"restarting after wave {last_wave} from {self.restart_file}")
+            self.block_sizes, imbalance = Utils.decompose(Utils.N, self.worker_count, self.waves,
+                                                          self.decomposition)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            comm.Abort(1)
+        if imbalance:
+            Utils.print_load_imbalance(imbalance)
 
         config_data = {
             'N': Utils.N,
             'W': Utils.W,
             'T': Utils.T,
             'R': Utils.R,
+            'grid': self.grid,
+            'row_cuts': Utils.row_cuts,
+            'column_cuts': Utils.column_cuts,
+            'rebalance': self.rebalance_threshold,
+            'output_format': self.output_format,
+            'halo': self.halo,
+            'halo_depth': self.halo_depth,
+            'output_file': self.output_file,
+            'checkpoint': self.checkpoint_every,
+            'restart': self.restart_file,
+            'first_wave': self.first_wave,
         }
-        # Broadcast config data to workers
+        # Broadcast config data to workers, then scatter their blocks, so the
+        # start-up takes two collectives whatever the number of ranks
         comm.bcast(config_data, root=0)
 
-        self.block_sizes = Utils.calculate_block_sizes(Utils.N, self.worker_count)
-
-        self.wave_data = self.parse_wave_data(self.lines)
-
-        self.blocks, self.block_ids = self.generate_blocks(self.block_sizes)
-        self.calculate_adjacent_blocks(self.block_ids, self.blocks)
+        self.blocks, self.block_ids = generate_blocks(self.block_sizes, self.block_class)
+        calculate_adjacent_blocks(self.block_ids, self.blocks)
+        self.scatter_blocks()
+        if self.restart_file:
+            read_checkpoint(comm, self.restart_file)
 
-        # Send empty blocks to workers
-        self.send_blocks()
-
-        for wave_idx in range(1, Utils.W + 1):
-            wave = self.wave_data[wave_idx]
-
-            blocks = [{} for _ in range(self.worker_count)]
-            for rank in range(1, self.worker_count + 1):
-                blocks[rank - 1]['units'] = []
-
-            for faction in wave:
-                for coord in wave[faction]:
-                    if(coord[0] < 0 or coord[1] < 0 or coord[0] >= Utils.N or coord[1] >= Utils.N):
-                        continue
-                    found_id = Utils.coordinates_to_block_id(coord[0], coord[1])
-                    blocks[found_id - 1]['units'].append((faction, coord[0], coord[1]))
+    def run(self):
+        self.setup()
 
-            
+        for wave_idx in range(self.first_wave, Utils.W + 1):
             # Send units to workers to update their blocks
-            self.send_units(blocks)
+            self.inject_wave(wave_idx)
 
             for _ in range(Utils.R):
-                for x in range(2):      # x in {0,1}
-                    for y in range(2):  # y in {0,1}
-                        current_workers = self.set_current_workers(x, y)
-                        # State to active: 2, inactive: 3
-                        self.set_states([2, 3], current_workers, x * 2 + y)
-
-                        # Wait for active workers to finish
-                        for rank in range(1, self.worker_count + 1):
-                            if current_workers[rank - 1]:
-                                comm.recv(source=rank, tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
-
-                        for rank in range(1, self.worker_count + 1):
-                            if not current_workers[rank - 1]:
-                                comm.send(None, dest=rank, tag=60)
+                # --- Boundary exchange, all workers at once ---
+                current_workers = [True] * self.worker_count
+                self.set_states([2, 2], current_workers, -1)
 
                 for x in range(2):
                     for y in range(2):
                         current_workers = self.set_current_workers(x, y)
                         # State to active: 10, inactive: 11
                         self.set_states([10, 11], current_workers, x * 2 + y)
-                        # Wait for active workers
-                        for rank in range(1, self.worker_count + 1):
-                            if current_workers[rank - 1]:
-                                comm.recv(source=rank, tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
-                        # Send "continue" or "skip" (tag=72)
-                        for rank in range(1, self.worker_count + 1):
-                            if not current_workers[rank - 1]:
-                                comm.send(None, dest=rank, tag=72)
+                        # Wait for active workers, they send one air batch to every neighbor themselves
+                        self.wait_active_workers(current_workers)
 
                 current_workers = [True] * self.worker_count
                 self.set_states([12, 12], current_workers, -1)
 
-                # --- Active time 2 (checkerboard step) ---
-                for x in range(2):
-                    for y in range(2):
-                        current_workers = self.set_current_workers(x, y)
-                        # State to active: 4, inactive: 5
-                        self.set_states([4, 5], current_workers, x * 2 + y)
-
-                        # Wait for active workers
-                        for rank in range(1, self.worker_count + 1):
-                            if current_workers[rank - 1]:
-                                comm.recv(source=rank, tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
-
-                        # Send "continue" or "skip" (tag=70)
-                        for rank in range(1, self.worker_count + 1):
-                            if not current_workers[rank - 1]:
-                                comm.send(None, dest=rank, tag=70)
-
+                # --- Active time 2 (all workers attack and swap damage batches) ---
                 current_workers = [True] * self.worker_count
+                self.set_states([4, 4], current_workers, -1)
                 self.set_states([6, 6], current_workers, -1)
                 self.set_states([7, 7], current_workers, -1)
 
-            for x in range(2):
-                for y in range(2):
-                    current_workers = self.set_current_workers(x, y)
-                    # State to active: 8, inactive: 9
-                    self.set_states([8, 9], current_workers, x * 2 + y)
-                    # Wait for active workers
-                    for rank in range(1, self.worker_count + 1):
-                        if current_workers[rank - 1]:
-                            comm.recv(source=rank, tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
-                    # Send "continue" or "skip" (tag=71)
-                    for rank in range(1, self.worker_count + 1):
-                        if not current_workers[rank - 1]:
-                            comm.send(None, dest=rank, tag=71)
-
+            # --- Flooding (all workers at once, one batch of requests per neighbor) ---
             current_workers = [True] * self.worker_count
+            self.set_states([8, 8], current_workers, -1)
             self.set_states([21, 21], current_workers, -1)
 
+            if self.checkpoint_due(wave_idx):
+                self.set_states([23, 23], current_workers, -1)
+                self.checkpoint(wave_idx)
+
+            if self.rebalance_threshold and wave_idx < Utils.W:
+                self.set_states([22, 22], current_workers, -1)
+                self.rebalance(wave_idx)
+
+        self.executor.shutdown()
         self.gather_grids_and_print()
     
         # Send termination signal to workers
         for rank in range(1, self.worker_count + 1):
-            comm.send({'state': -1}, dest=rank, tag=10)
+            self.send_state(-1, rank)
+
+    def run_autonomous(self):
+        """
+        Manager side of the autonomous schedule. Workers play the rounds on
+        their own, so the manager only sends the blocks, injects the units of
+        every wave and collects the blocks at the end.
+        """
+        # The workers get a communicator without the manager for their barriers
+        comm.Split(MPI.UNDEFINED)
+        self.setup()
+
+        for wave_idx in range(self.first_wave, Utils.W + 1):
+            self.inject_wave(wave_idx, set_state=False)
+            if self.checkpoint_due(wave_idx):
+                self.checkpoint(wave_idx)
+            if self.rebalance_threshold and wave_idx < Utils.W:
+                self.rebalance(wave_idx)
+
+        self.executor.shutdown()
+        self.gather_grids_and_print(request_blocks=False)
@@ -0,0 +1,50 @@
+from utils import Utils
+from array_block import ArrayBlock
+from waves import open_waves, read_header, allocate_grid_file, write_block_cells
+
+
+class SerialEngine:
+    """
+    Plays the whole simulation in one process, without MPI. The grid is a single
+    ArrayBlock covering all N x N cells, so there are no boundaries to exchange
+    and every phase is one whole-grid array operation. It follows the phase
+    order of the workers and writes the same output as the MPI engine.
+    """
+
+    def __init__(self, input_file, output_file, output_format="text"):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.output_format = output_format
+
+    def setup(self):
+        Utils.parse_general_info(read_header(self.input_file))
+        self.waves = open_waves(self.input_file)
+        self.block = ArrayBlock({"E": [], "F": [], "W": [], "A": []}, (0, 0), (Utils.N, Utils.N),
+                                1, [], (Utils.N, Utils.N))
+
+    # Units of a wave in the order the manager distributes them
+    def add_units(self, wave):
+        units = []
+        for faction in wave:
+            for x, y in wave[faction]:
+                if 0 <= x < Utils.N and 0 <= y < Utils.N:
+                    units.append((faction, x, y))
+        self.block.add_units(units)
+
+    def run(self):
+        self.setup()
+
+        for wave_idx in range(1, Utils.W + 1):
+            self.add_units(self.waves.wave(wave_idx))
+            # Cells outside the grid are empty on the boundary, so nothing is
+            # attacked there and no air unit leaves the block
+            for _ in range(Utils.R):
+                self.block.play_round()
+            self.block.end_wave()
+
+        if self.output_format == "binary":
+            allocate_grid_file(self.output_file, Utils.N)
+            write_block_cells(self.output_file, Utils.N, (0, 0), (Utils.N, Utils.N), self.block.pack_grid())
+            return
+        with open(self.output_file, "w") as output:
+            Utils.print_grid(self.block.unit_types(), output)
@@ -0,0 +1,254 @@
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from threading import BrokenBarrierError
+from utils import Utils
+from block import Block, generate_blocks, calculate_adjacent_blocks
+from array_block import ArrayBlock, EMPTY, TYPE_CHARS, TYPE_BYTES
+from unit import AirUnit
+from constants import AIR
+from waves import open_waves, read_header, allocate_grid_file, write_block_cells
+
+# Per cell arrays of the whole grid kept in shared memory, see ArrayBlock
+GRID_FIELDS = [('faction', np.int8), ('health', np.int16), ('damage_taken', np.int16),
+               ('attack_power', np.int16), ('attack_done', bool), ('inferno_targets', np.uint8)]
+# Per block padded arrays a block leaves for its neighbors: the damage it dealt
+# on its boundary and the health and attack power of the air units moving there
+SPILL_FIELDS = [('damage', np.int16), ('air_health', np.int16), ('air_attack_power', np.int16)]
+
+
+def attach(name, shape, dtype):
+    """
+    Numpy view of a shared memory segment, the segment is returned too and
+    has to be kept alive as long as the view is used.
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    return segment, np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+
+class SharedArrayBlock(ArrayBlock):
+    """
+    ArrayBlock whose unit arrays are views into the grid in shared memory, so
+    other processes can read the cells of the block. The boundary is read from
+    the shared grid instead of being received from the neighbors, and what a
+    block does to its neighbors' cells is left in its spill arrays for them to
+    pick up.
+    """
+
+    def create_grid(self):
+        shape = (self.size[1], self.size[0])
+        self.grid_with_boundary = np.zeros((shape[0] + 6, shape[1] + 6), dtype=np.int8)
+
+    def attach(self, grid, spills):
+        """
+        grid maps the GRID_FIELDS names to the whole grid arrays and spills maps
+        the SPILL_FIELDS names to arrays with the padded area of every block.
+        """
+        self.grid = grid
+        self.spills = spills
+        block = (slice(self.top_left[0], self.bottom_right[0]), slice(self.top_left[1], self.bottom_right[1]))
+        for field, _ in GRID_FIELDS:
+            setattr(self, field, grid[field][block])
+
+    # the part of the padded area of block_id that covers cells of this block
+    def overlap(self, block_id, top_left, bottom_right):
+        rows = (max(top_left[0] - 3, self.top_left[0]), min(bottom_right[0] + 3, self.bottom_right[0]))
+        columns = (max(top_left[1] - 3, self.top_left[1]), min(bottom_right[1] + 3, self.bottom_right[1]))
+        spill = (block_id - 1,
+                 slice(rows[0] - top_left[0] + 3, rows[1] - top_left[0] + 3),
+                 slice(columns[0] - top_left[1] + 3, columns[1] - top_left[1] + 3))
+        own = (slice(rows[0] - self.top_left[0], rows[1] - self.top_left[0]),
+               slice(columns[0] - self.top_left[1], columns[1] - self.top_left[1]))
+        return spill, own
+
+    def reset_boundary(self):
+        padded = self.grid_with_boundary
+        padded[:] = EMPTY
+        rows = (max(self.top_left[0] - 3, 0), min(self.bottom_right[0] + 3, Utils.N))
+        columns = (max(self.top_left[1] - 3, 0), min(self.bottom_right[1] + 3, Utils.N))
+        padded[rows[0] - self.top_left[0] + 3:rows[1] - self.top_left[0] + 3,
+               columns[0] - self.top_left[1] + 3:columns[1] - self.top_left[1] + 3] = \
+            self.grid['faction'][rows[0]:rows[1], columns[0]:columns[1]]
+
+    def spill_damage(self):
+        height, width = self.faction.shape
+        self.spills['damage'][self.id - 1, :height + 6, :width + 6] = self.attack_damage()
+
+    def take_spilled_damage(self, neighbor_blocks):
+        for neighbor in neighbor_blocks:
+            spill, own = self.overlap(neighbor.id, neighbor.top_left, neighbor.bottom_right)
+            self.damage_taken[own] += self.spills['damage'][spill]
+
+    def leave_air_unit(self, air_unit: AirUnit):
+        """
+        Puts an air unit moving to a neighbor on the spill arrays, uniting it
+        with the units already moving to the same cell.
+        """
+        i = air_unit.x - self.top_left[0] + 3
+        j = air_unit.y - self.top_left[1] + 3
+        health = self.spills['air_health'][self.id - 1]
+        attack_power = self.spills['air_attack_power'][self.id - 1]
+        health[i, j] = min(AIR['HEALTH'], int(health[i, j]) + air_unit.health)
+        attack_power[i, j] += air_unit.attack_power
+
+    def take_air_units(self, neighbor_blocks):
+        for neighbor in neighbor_blocks:
+            spill, own = self.overlap(neighbor.id, neighbor.top_left, neighbor.bottom_right)
+            health = self.spills['air_health'][spill]
+            attack_power = self.spills['air_attack_power'][spill]
+            for i, j in np.argwhere(health):
+                x = own[0].start + int(i) + self.top_left[0]
+                y = own[1].start + int(j) + self.top_left[1]
+                self.place_air_unit(AirUnit.from_record((x, y, int(health[i, j]), int(attack_power[i, j]))))
+
+
+def run_block(geometry, neighbor_geometries, config, input_file, names, barrier):
+    """
+    Plays one block in a process of the pool. The phases of all blocks are kept
+    in step by the barrier: after a barrier every block may read what the
+    others wrote before it. Every block reads the waves from the input file
+    itself, one wave at a time.
+    """
+    Utils.N, Utils.W, Utils.R = config['N'], config['W'], config['R']
+    Utils.set_worker_count(config['worker_count'])
+    block: SharedArrayBlock = SharedArrayBlock.from_geometry(geometry)
+    neighbor_blocks = [Block.from_geometry(values) for values in neighbor_geometries]
+
+    segments = []
+    grid = {}
+    for field, dtype in GRID_FIELDS:
+        segment, grid[field] = attach(names[field], (Utils.N, Utils.N), dtype)
+        segments.append(segment)
+    spills = {}
+    for field, dtype in SPILL_FIELDS:
+        segment, spills[field] = attach(names[field], config['spill_shape'], dtype)
+        segments.append(segment)
+    block.attach(grid, spills)
+    waves = open_waves(input_file)
+
+    try:
+        for wave_idx in range(1, Utils.W + 1):
+            wave = waves.wave(wave_idx)
+            block.add_units([(faction, x, y) for faction in wave for x, y in wave[faction]
+                             if 0 <= x < Utils.N and 0 <= y < Utils.N and block.is_coordinate_inside(x, y)])
+
+            for _ in range(Utils.R):
+                # every block reads its boundary before any unit moves
+                barrier.wait()
+                block.reset_boundary()
+                barrier.wait()
+                block.apply_inferno()
+
+                air_moves = block.air_moves()
+                spills['air_health'][block.id - 1] = 0
+                spills['air_attack_power'][block.id - 1] = 0
+                for air_unit in block.remove_air_units():
+                    air_unit.change_position(air_moves[(air_unit.x, air_unit.y)])
+                    if block.is_coordinate_inside(air_unit.x, air_unit.y):
+                        block.place_air_unit(air_unit)
+                    else:
+                        block.leave_air_unit(air_unit)
+                barrier.wait()
+                block.take_air_units(neighbor_blocks)
+
+                # attacking does not change any faction, so the boundary can be
+                # read while the neighbors attack
+                barrier.wait()
+                block.reset_boundary()
+                block.spill_damage()
+                barrier.wait()
+                block.take_spilled_damage(neighbor_blocks)
+                block.resolve()
+                block.heal()
+
+            barrier.wait()
+            block.reset_boundary()
+            barrier.wait()
+            block.place_water_units(block.flood())
+            block.reset_inferno()
+        barrier.wait()
+    except BrokenBarrierError:
+        # another block failed, it reports the error
+        return
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        del block, grid, spills
+        for segment in segments:
+            segment.close()
+
+
+class SharedMemoryEngine:
+    """
+    Runs the blocks of the MPI decomposition in a pool of processes on one
+    machine, without MPI. The grid lives in shared memory, so reading the
+    boundary is a read of the neighbors' cells and the handshakes of the
+    worker states are replaced by a barrier between the phases.
+    """
+
+    def __init__(self, input_file, output_file, worker_count, decomposition="equal", output_format="text"):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.output_format = output_format
+        self.worker_count = worker_count
+        self.decomposition = decomposition
+
+    def setup(self):
+        Utils.parse_general_info(read_header(self.input_file))
+        Utils.set_worker_count(self.worker_count)
+
+        block_sizes, imbalance = Utils.decompose(Utils.N, self.worker_count, open_waves(self.input_file),
+                                                 self.decomposition)
+        if imbalance:
+            Utils.print_load_imbalance(imbalance)
+        self.blocks, block_ids = generate_blocks(block_sizes, Block)
+        calculate_adjacent_blocks(block_ids, self.blocks)
+
+    def run(self):
+        self.setup()
+
+        height = max(block.size[1] for block in self.blocks) + 6
+        width = max(block.size[0] for block in self.blocks) + 6
+        config = {'N': Utils.N, 'W': Utils.W, 'R': Utils.R, 'worker_count': self.worker_count,
+                  'spill_shape': (self.worker_count, height, width)}
+
+        segments = {}
+        try:
+            for field, dtype in GRID_FIELDS:
+                segments[field] = shared_memory.SharedMemory(
+                    create=True, size=Utils.N * Utils.N * np.dtype(dtype).itemsize)
+                np.ndarray((Utils.N, Utils.N), dtype=dtype, buffer=segments[field].buf)[:] = 0
+            for field, dtype in SPILL_FIELDS:
+                segments[field] = shared_memory.SharedMemory(
+                    create=True, size=self.worker_count * height * width * np.dtype(dtype).itemsize)
+                np.ndarray(config['spill_shape'], dtype=dtype, buffer=segments[field].buf)[:] = 0
+            names = {field: segment.name for field, segment in segments.items()}
+
+            barrier = multiprocessing.Barrier(self.worker_count)
+            processes = []
+            for block in self.blocks:
+                neighbor_geometries = [self.blocks[neighbor['block_id'] - 1].pack_geometry()
+                                       for neighbor in block.adjacent_blocks]
+                processes.append(multiprocessing.Process(
+                    target=run_block,
+                    args=(block.pack_geometry(), neighbor_geometries, config, self.input_file, names, barrier)))
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            if any(process.exitcode != 0 for process in processes):
+                raise RuntimeError("a block process failed")
+
+            faction = np.ndarray((Utils.N, Utils.N), dtype=np.int8, buffer=segments['faction'].buf)
+            if self.output_format == "binary":
+                allocate_grid_file(self.output_file, Utils.N)
+                write_block_cells(self.output_file, Utils.N, (0, 0), (Utils.N, Utils.N), TYPE_BYTES[faction].tobytes())
+            else:
+                with open(self.output_file, "w") as output:
+                    Utils.print_grid(TYPE_CHARS[faction].tolist(), output)
+            del faction
+        finally:
+            for segment in segments.values():
+                segment.close()
+                segment.unlink()
@@ -0,0 +1,107 @@
+from array import array
+from itertools import chain
+from mpi4py import MPI
+from instrumentation import profile
+
+# Every message except the initial config is sent as a flat buffer of 16 bit
+# ints with the buffer based Send/Recv of mpi4py, so nothing is pickled.
+# Coordinates, health and attack power all fit, like in the int16 arrays of
+# ArrayBlock, as the grid size is checked against MAX_GRID_SIZE at start-up.
+# Messages with a variable number of records are probed first to size the
+# buffer.
+TYPECODE = 'h'
+MPI_TYPE = MPI.SHORT
+
+
+def pack_records(records):
+    """
+    Flattens a list of equal length integer tuples into an int buffer.
+    """
+    return array(TYPECODE, chain.from_iterable(records))
+
+
+def unpack_records(buffer, width):
+    return list(zip(*[iter(buffer)] * width))
+
+
+def send_ints(comm, values, dest, tag):
+    buffer = array(TYPECODE, values)
+    profile.sent(tag, len(buffer) * buffer.itemsize)
+    comm.Send([buffer, MPI_TYPE], dest=dest, tag=tag)
+
+
+def recv_ints(comm, count, source, tag, status=None):
+    buffer = array(TYPECODE, bytes(count * buffer_itemsize()))
+    with profile.blocking():
+        comm.Recv([buffer, MPI_TYPE], source=source, tag=tag, status=status)
+    return buffer
+
+
+def scatter_ints(comm, values, count, root=0):
+    """
+    Scatters count ints to every rank, values holds the ints of all the ranks
+    one rank after the other on root and is ignored elsewhere.
+    """
+    buffer = array(TYPECODE, bytes(count * buffer_itemsize()))
+    send = [array(TYPECODE, values), MPI_TYPE] if comm.Get_rank() == root else None
+    with profile.blocking():
+        comm.Scatter(send, [buffer, MPI_TYPE], root=root)
+    return buffer
+
+
+def scatter_records(comm, buffer, counts, width, root=0):
+    """
+    Scatters records to every rank with one Scatterv. On root buffer holds the
+    flat ints of all the ranks one rank after the other and counts how many
+    ints each rank gets, both are ignored elsewhere. The counts go first with
+    a Scatter of 32 bit ints, as receivers have to size their buffers and a
+    rank can get more ints than int16 holds. Returns the records of the
+    calling rank.
+    """
+    count = array('i', [0])
+    with profile.blocking():
+        comm.Scatter([array('i', counts), MPI.INT] if comm.Get_rank() == root else None,
+                     [count, MPI.INT], root=root)
+    received = array(TYPECODE, bytes(count[0] * buffer_itemsize()))
+
+    if comm.Get_rank() != root:
+        with profile.blocking():
+            comm.Scatterv(None, [received, MPI_TYPE], root=root)
+        return unpack_records(received, width)
+
+    displacements = [sum(counts[:rank]) for rank in range(len(counts))]
+    profile.sent('scatterv', sum(counts) * buffer_itemsize())
+    comm.Scatterv([buffer, (counts, displacements), MPI_TYPE], [received, MPI_TYPE], root=root)
+    return unpack_records(received, width)
+
+
+def send_records(comm, records, dest, tag):
+    buffer = pack_records(records)
+    profile.sent(tag, len(buffer) * buffer.itemsize)
+    comm.Send([buffer, MPI_TYPE], dest=dest, tag=tag)
+
+
+def isend_records(comm, records, dest, tag):
+    """
+    Non-blocking send_records, the returned buffer has to be kept alive
+    until the request completes.
+    """
+    buffer = pack_records(records)
+    profile.sent(tag, len(buffer) * buffer.itemsize)
+    return comm.Isend([buffer, MPI_TYPE], dest=dest, tag=tag), buffer
+
+
+def recv_records(comm, width, source, tag):
+    """
+    Receives a message of any length sent with send_records, the records are
+    returned as tuples of width integers.
+    """
+    status = MPI.Status()
+    with profile.blocking():
+        comm.Probe(source=source, tag=tag, status=status)
+    buffer = recv_ints(comm, status.Get_count(MPI_TYPE), status.Get_source(), tag)
+    return unpack_records(buffer, width)
+
+
+def buffer_itemsize():
+    return array(TYPECODE).itemsize
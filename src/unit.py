@@ -1,85 +1,119 @@
+from constants import EARTH, FIRE, WATER, AIR, FIRE_MAX_ATTACK
+
+
 class Unit:
-    def __init__(self, unit_type, x, y, max_health, attack_power, healing_rate):
-        self.unit_type = unit_type  # Unit type: E, F, W, A .
+    """
+    Only the state that changes during the game is kept per unit, in slots.
+    The unit type, maximum health, healing rate and attack directions are the
+    same for every unit of a faction, so they are class attributes taken from
+    constants.py and shared by all its units.
+    """
+    __slots__ = ('x', 'y', 'health', 'attack_power', 'damage_taken', 'attack_done')
+
+    unit_type = None  # Unit type: E, F, W, A .
+    max_health = 0  # Maximum health points
+    healing_rate = 0  # Healing rate when not attacking
+    directions = ()
+
+    def __init__(self, x, y, attack_power):
         self.x = x  # X-coordinate
         self.y = y  # Y-coordinate
-        self.max_health = max_health  # Maximum health points
-        self.health = max_health  # Current health points
+        self.health = self.max_health  # Current health points
         self.attack_power = attack_power  # Attack damage
-        self.healing_rate = healing_rate  # Healing rate when not attacking
         self.damage_taken = 0
         self.attack_done = False
 
     def is_alive(self):
         return self.health > 0
-    
+
     def can_attack(self):
         return self.health >= self.max_health // 2
 
     def __str__(self):
         return self.unit_type
+
     def heal(self):
-        return
+        self.health = min(self.max_health, self.health + self.healing_rate)
 
 
 class EarthUnit(Unit):
+    __slots__ = ()
+
+    unit_type = "E"
+    max_health = EARTH['HEALTH']
+    healing_rate = EARTH['HEALING']
+    directions = EARTH['DIRECTIONS']
+
     def __init__(self, x, y):
-        super().__init__(unit_type="E", x=x, y=y, max_health=18, attack_power=2, healing_rate=3)
-        self.directions = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+        super().__init__(x, y, EARTH['ATTACK'])
 
     def fortify(self):
         self.damage_taken = max(0, self.damage_taken // 2)
 
-    def heal(self):
-        self.health = min(18, self.health + self.healing_rate)
-
 
 class FireUnit(Unit):
+    __slots__ = ('enemies_attacked',)
+
+    unit_type = "F"
+    max_health = FIRE['HEALTH']
+    healing_rate = FIRE['HEALING']
+    directions = FIRE['DIRECTIONS']
+    base_attack_power = FIRE['ATTACK']
+
     def __init__(self, x, y):
-        super().__init__(unit_type="F", x=x, y=y, max_health=12, attack_power=4, healing_rate=1)
-        self.base_attack_power = 4
-        self.attack_power = self.base_attack_power
+        super().__init__(x, y, self.base_attack_power)
         self.enemies_attacked = []
-        self.directions = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
 
     def inferno(self):
-        if self.attack_power < 6:
+        if self.attack_power < FIRE_MAX_ATTACK:
             self.attack_power += 1
 
     def reset_inferno(self):
         self.attack_power = self.base_attack_power
-        self.enemies_attacked=[]
+        self.enemies_attacked.clear()
 
     def reset_enemies_attacked(self):
-        self.enemies_attacked = []
-
-    def heal(self):
-        self.health = min(12, self.health + self.healing_rate)
+        self.enemies_attacked.clear()
 
 
 class WaterUnit(Unit):
-    def __init__(self, x, y):
-        super().__init__(unit_type="W", x=x, y=y, max_health=14, attack_power=3, healing_rate=2)
-        self.directions = [(-1, -1), (1, 1), (-1, 1), (1, -1)]
+    __slots__ = ()
 
-    def heal(self):
-        self.health = min(14, self.health + self.healing_rate)
+    unit_type = "W"
+    max_health = WATER['HEALTH']
+    healing_rate = WATER['HEALING']
+    directions = WATER['DIRECTIONS']
 
+    def __init__(self, x, y):
+        super().__init__(x, y, WATER['ATTACK'])
 
 
+class AirUnit(Unit):
+    __slots__ = ()
 
+    unit_type = "A"
+    max_health = AIR['HEALTH']
+    healing_rate = AIR['HEALING']
+    directions = AIR['DIRECTIONS']
 
-class AirUnit(Unit):
     def __init__(self, x, y):
-        super().__init__(unit_type="A", x=x, y=y, max_health=10, attack_power=2, healing_rate=2)
-        self.directions = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+        super().__init__(x, y, AIR['ATTACK'])
+
+    # x, y, health and attack power as sent between workers. Air units move
+    # right after healing, so damage_taken is 0 and attack_done is False then
+    def to_record(self):
+        return (self.x, self.y, self.health, self.attack_power)
+
+    @classmethod
+    def from_record(cls, record):
+        air_unit = cls(record[0], record[1])
+        air_unit.health = record[2]
+        air_unit.attack_power = record[3]
+        return air_unit
 
     def change_position(self,new_coordinates):
         self.x , self.y = new_coordinates
 
     def unite(self, air_unit):
-        self.health = min(10, self.health + air_unit.health)
+        self.health = min(self.max_health, self.health + air_unit.health)
         self.attack_power += air_unit.attack_power
-
-    def heal(self):
-        self.health = min(10, self.health + self.healing_rate)
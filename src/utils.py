@@ -1,4 +1,9 @@
-from mpi4py import MPI
+from array import array
+from bisect import bisect_right
+
+# Coordinates travel between the ranks as int16 (see transport.py), so every
+# one of them has to fit
+MAX_GRID_SIZE = 2 ** 15 - 1
 
 class Utils:
     # Class-level defaults (will be updated after parsing)
@@ -7,10 +12,38 @@ class Utils:
     T = 0
     R = 0
 
-    # MPI world
-    comm = MPI.COMM_WORLD
-    worker_count = comm.Get_size() - 1
-    sqr_of_worker_count = int(worker_count ** 0.5)
+    # Set from the size of the MPI world by set_worker_count, the serial
+    # engine runs without MPI. Blocks form a grid of block_rows x block_columns
+    worker_count = 0
+    block_rows = 0
+    block_columns = 0
+
+    # First grid row (column) of every block row (column) followed by N, set by
+    # calculate_block_sizes
+    row_cuts = []
+    column_cuts = []
+
+    # Block row of every grid row and block column of every grid column, filled
+    # by build_block_lookup once the cuts are known
+    block_row_of = array('i')
+    block_column_of = array('i')
+
+    @classmethod
+    def set_worker_count(cls, worker_count):
+        cls.worker_count = worker_count
+        cls.block_rows, cls.block_columns = cls.choose_dims(worker_count)
+
+    @classmethod
+    def choose_dims(cls, worker_count):
+        """
+        Splits the workers into block_rows x block_columns with the shortest
+        total boundary, N * (rows + columns - 2), so the factors closest to each
+        other. Like MPI.Compute_dims the larger factor comes first.
+        """
+        columns = int(worker_count ** 0.5)
+        while worker_count % columns:
+            columns -= 1
+        return worker_count // columns, columns
 
     @classmethod
     def parse_general_info(cls, lines):
@@ -24,53 +57,199 @@ class Utils:
         cls.R = int(first_line[3])  # Rounds per wave
 
     @classmethod
-    def calculate_block_sizes(cls, n, worker_count):
+    def print_grid(cls, grid, file):
         """
-        Calculates block sizes using the class's sqr_of_worker_count.
-        You can also omit n and worker_count if you prefer using cls.N/cls.worker_count.
+        Writes the final grid, two characters per cell and a blank line after it.
         """
-        # If you want to rely on class attributes, you can do:
-        # n = n or cls.N
-        # worker_count = worker_count or cls.worker_count
-        # but here it takes them as parameters explicitly.
-        initial_block_size = n // cls.sqr_of_worker_count
-        remaining_size = n % cls.sqr_of_worker_count
-        block_sizes = []
+        for row in grid:
+            file.write(''.join(cell.ljust(2, ' ') for cell in row) + '\n')
+        file.write('\n')
+
+    @classmethod
+    def calculate_block_sizes(cls, n, worker_count, wave_data=None):
+        """
+        Calculates the (width, height) of every block of the block_rows x
+        block_columns grid. Without wave_data the first n % count rows and
+        columns of blocks get one cell more, with it the cuts balance the units
+        of all the waves between the rows and between the columns of blocks.
+        """
+        if n > MAX_GRID_SIZE:
+            raise ValueError(f"the {n}x{n} grid is larger than {MAX_GRID_SIZE}x{MAX_GRID_SIZE}, "
+                             f"its coordinates do not fit in int16")
+
+        # The boundary is 3 cells deep and only comes from adjacent blocks
+        for count in (cls.block_rows, cls.block_columns):
+            if count > 1 and n // count < 3:
+                raise ValueError(f"{worker_count} workers split the {n}x{n} grid into blocks "
+                                 f"narrower than 3 cells")
+
+        if wave_data is None:
+            cls.row_cuts = cls.equal_cuts(n, cls.block_rows)
+            cls.column_cuts = cls.equal_cuts(n, cls.block_columns)
+        else:
+            cls.row_cuts, cls.column_cuts = cls.cuts_for_units(cls.wave_units(wave_data))
+
+        return cls.block_sizes_from_cuts()
 
-        for i in range(cls.sqr_of_worker_count):
+    @classmethod
+    def block_sizes_from_cuts(cls):
+        block_sizes = []
+        for i in range(cls.block_rows):
             row_sizes = []
-            for j in range(cls.sqr_of_worker_count):
-                width  = initial_block_size + (j < remaining_size)
-                height = initial_block_size + (i < remaining_size)
+            for j in range(cls.block_columns):
+                width  = cls.column_cuts[j + 1] - cls.column_cuts[j]
+                height = cls.row_cuts[i + 1] - cls.row_cuts[i]
                 row_sizes.append((width, height))
             block_sizes.append(row_sizes)
 
         return block_sizes
 
+    @classmethod
+    def equal_cuts(cls, n, count):
+        return [k * (n // count) + min(k, n % count) for k in range(count + 1)]
+
+    @classmethod
+    def balanced_cuts(cls, weights, count):
+        """
+        Cuts weights into count parts of at least 3 cells, every cut is placed
+        where the weight before it is closest to its share of the total.
+        """
+        n = len(weights)
+        total = sum(weights)
+        if total == 0:
+            return cls.equal_cuts(n, count)
+
+        prefix = [0]
+        for weight in weights:
+            prefix.append(prefix[-1] + weight)
+
+        cuts = [0]
+        for k in range(1, count):
+            target = total * k / count
+            cuts.append(min(range(cuts[-1] + 3, n - 3 * (count - k) + 1), key=lambda cut: abs(prefix[cut] - target)))
+        cuts.append(n)
+        return cuts
+
+    @classmethod
+    def cuts_for_units(cls, positions):
+        """
+        Row and column cuts that balance the units at positions.
+        """
+        units_per_row = [0] * cls.N
+        units_per_column = [0] * cls.N
+        for x, y in positions:
+            units_per_row[x] += 1
+            units_per_column[y] += 1
+        return cls.cuts_for_lines(units_per_row, units_per_column)
+
+    @classmethod
+    def cuts_for_lines(cls, units_per_row, units_per_column):
+        """
+        Row and column cuts that balance the units counted on every row and
+        every column of the grid.
+        """
+        return cls.balanced_cuts(units_per_row, cls.block_rows), cls.balanced_cuts(units_per_column, cls.block_columns)
+
+    @classmethod
+    def block_rectangle(cls, block_id, row_cuts, column_cuts):
+        """
+        top_left and bottom_right of a block under the given cuts.
+        """
+        i, j = divmod(block_id - 1, len(column_cuts) - 1)
+        return (row_cuts[i], column_cuts[j]), (row_cuts[i + 1], column_cuts[j + 1])
+
+    @classmethod
+    def overlap(cls, first, second):
+        """
+        Common part of two (top_left, bottom_right) rectangles, None if they do not meet.
+        """
+        top_left = (max(first[0][0], second[0][0]), max(first[0][1], second[0][1]))
+        bottom_right = (min(first[1][0], second[1][0]), min(first[1][1], second[1][1]))
+        if top_left[0] >= bottom_right[0] or top_left[1] >= bottom_right[1]:
+            return None
+        return top_left, bottom_right
+
+    @classmethod
+    def wave_units(cls, wave_data):
+        """
+        Coordinates of the units of all waves that fall inside the grid,
+        wave_data is any iterable of waves, such as a WaveReader.
+        """
+        for wave in wave_data:
+            for coords in wave.values():
+                for x, y in coords:
+                    if 0 <= x < cls.N and 0 <= y < cls.N:
+                        yield x, y
+
+    @classmethod
+    def units_per_block(cls, positions, row_cuts, column_cuts):
+        units = [0] * ((len(row_cuts) - 1) * (len(column_cuts) - 1))
+        for x, y in positions:
+            i = bisect_right(row_cuts, x) - 1
+            j = bisect_right(column_cuts, y) - 1
+            units[i * (len(column_cuts) - 1) + j] += 1
+        return units
+
+    @classmethod
+    def imbalance(cls, units):
+        """
+        Most units on a worker over the mean per worker, 1.0 is a perfect balance.
+        """
+        if sum(units) == 0:
+            return 1.0
+        return max(units) * len(units) / sum(units)
+
+    @classmethod
+    def load_imbalance(cls, wave_data):
+        return cls.imbalance(cls.units_per_block(cls.wave_units(wave_data), cls.row_cuts, cls.column_cuts))
+
+    @classmethod
+    def decompose(cls, n, worker_count, wave_data, decomposition="equal"):
+        """
+        Block sizes for the --decomposition option, "equal" areas or "balanced"
+        units. The lookup tables are built for them. The load imbalance of the
+        equal split and of the balanced one are returned with them, to report.
+        """
+        block_sizes = cls.calculate_block_sizes(n, worker_count)
+        cls.build_block_lookup()
+        if decomposition == "equal":
+            return block_sizes, {}
+
+        imbalance = {'equal': cls.load_imbalance(wave_data)}
+        block_sizes = cls.calculate_block_sizes(n, worker_count, wave_data)
+        cls.build_block_lookup()
+        imbalance['balanced'] = cls.load_imbalance(wave_data)
+        return block_sizes, imbalance
+
+    @classmethod
+    def print_load_imbalance(cls, imbalance):
+        print("load imbalance (most units per worker / mean): "
+              + ", ".join(f"{decomposition} {factor:.2f}" for decomposition, factor in imbalance.items()))
+
+    @classmethod
+    def build_block_lookup(cls):
+        cls.block_row_of = array('i', [bisect_right(cls.row_cuts, y) - 1 for y in range(cls.N)])
+        cls.block_column_of = array('i', [bisect_right(cls.column_cuts, x) - 1 for x in range(cls.N)])
+
     @classmethod
     def coordinates_to_block_id(cls, y, x):
 
         """
-        Computes block ID given (x, y) coordinates, using the class's sqr_of_worker_count.
+        Computes block ID given (x, y) coordinates, y is the row and x the column.
         """
-        n = cls.N
-        block_size = n // cls.sqr_of_worker_count
-        remaining_size = n % cls.sqr_of_worker_count
+        return cls.block_row_of[y] * cls.block_columns + cls.block_column_of[x] + 1
 
-        # Adjust x, y and compute block ID
-        if x > remaining_size * (block_size + 1):
-            x -= remaining_size
-            if y > remaining_size * (block_size + 1):
-                y -= remaining_size
-                return (x // block_size) + (y // block_size) * cls.sqr_of_worker_count + 1    
-            else:
-                return (x // block_size) + (y // (block_size + 1)) * cls.sqr_of_worker_count + 1
-        else:
-            if y > remaining_size * (block_size + 1):
-                y -= remaining_size
-                return (x // (block_size + 1)) + (y // block_size) * cls.sqr_of_worker_count + 1
-            else:
-                return (x // (block_size + 1)) + (y // (block_size + 1)) * cls.sqr_of_worker_count + 1
+    @classmethod
+    def coordinates_to_block_ids(cls, ys, xs):
+        """
+        Block IDs of many cells at once. NumPy arrays of coordinates are looked
+        up with one fancy index, other sequences cell by cell.
+        """
+        if hasattr(ys, 'dtype'):
+            import numpy as np
+            return (np.asarray(cls.block_row_of)[ys] * cls.block_columns
+                    + np.asarray(cls.block_column_of)[xs] + 1)
+        return [cls.block_row_of[y] * cls.block_columns + cls.block_column_of[x] + 1 for y, x in zip(ys, xs)]
 
     @classmethod
     def is_current_worker(cls, worker_id, current_worker_group):
@@ -81,6 +260,6 @@ class Utils:
             return True
         # Convert worker_id to 0-based
         worker_id -= 1
-        x = worker_id // cls.sqr_of_worker_count
-        y = worker_id % cls.sqr_of_worker_count
+        x = worker_id // cls.block_columns
+        y = worker_id % cls.block_columns
         return (x % 2 == current_worker_group // 2) and (y % 2 == current_worker_group % 2)
\ No newline at end of file
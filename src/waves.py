@@ -0,0 +1,185 @@
+import mmap
+from array import array
+
+# First bytes of a binary scenario, see write_binary_scenario
+SCENARIO_MAGIC = b"EPCW"
+
+FACTION_LINES = ("E:", "F:", "W:", "A:")
+
+
+def empty_wave():
+    return {"E": [], "F": [], "W": [], "A": []}
+
+
+def parse_coordinates(text):
+    """
+    (x, y) pairs of a faction line after its "E:" prefix, "x y, x y, ...".
+    The numbers are split on whitespace once the commas are gone, which is
+    much faster than matching every pair with a regular expression. Signs
+    are kept, so "-3 5" is (-3, 5) and is dropped as outside the grid, where
+    the regular expression read (3, 5). A line with an odd number of values
+    raises ValueError.
+    """
+    values = list(map(int, text.replace(',', ' ').split()))
+    if len(values) % 2:
+        raise ValueError(f"odd number of coordinates in faction line: {text.strip()!r}")
+    pairs = iter(values)
+    return list(zip(pairs, pairs))
+
+
+def read_header(input_file):
+    """
+    First line of the input as a one line list, for Utils.parse_general_info.
+    Binary scenarios keep the same four numbers at the start.
+    """
+    if is_binary_scenario(input_file):
+        with open(input_file, "rb") as file:
+            file.read(len(SCENARIO_MAGIC))
+            return [" ".join(map(str, array('i', file.read(4 * 4))))]
+    with open(input_file, "r") as file:
+        return [file.readline()]
+
+
+def read_waves(input_file):
+    """
+    Unit positions of every wave by faction, read from the file one wave at a
+    time, so only the wave being read is ever in memory.
+    """
+    with open(input_file, "r") as file:
+        file.readline()
+        wave = None
+        for line in file:
+            line = line.strip()
+            if line.startswith("Wave"):
+                if wave is not None:
+                    yield wave
+                wave = empty_wave()
+            elif line.startswith(FACTION_LINES):
+                wave[line[0]] = parse_coordinates(line[2:])
+        if wave is not None:
+            yield wave
+
+
+class WaveReader:
+    """
+    Waves of an input file parsed when they are needed. wave(index) moves
+    forward through the file and keeps only the last wave it read, and every
+    iteration over the reader is a new pass over all the waves, for the
+    decomposition that needs the units of all of them.
+    """
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.waves = read_waves(input_file)
+        self.index = 0
+        self.current = empty_wave()
+
+    def __iter__(self):
+        return read_waves(self.input_file)
+
+    def wave(self, index):
+        """
+        Units of wave index, waves are numbered from 1 and asked for in order.
+        Waves missing from the file have no units.
+        """
+        if index < self.index:
+            raise ValueError(f"wave {index} was already read, the reader is at wave {self.index}")
+        while self.index < index:
+            self.current = next(self.waves, None) or empty_wave()
+            self.index += 1
+        return self.current
+
+
+class BinaryWaveReader:
+    """
+    Waves of a binary scenario, see write_binary_scenario. The file is memory
+    mapped and a wave is a slice of it, so waves can be read in any order and
+    only the pages of the waves asked for are ever loaded.
+    """
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        with open(input_file, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        values = memoryview(self.map)[len(SCENARIO_MAGIC):].cast('i')
+        self.header = values[:4].tolist()
+        waves = self.header[1]
+        counts = values[4:4 + 4 * waves]
+        self.values = values[4 + 4 * waves:]
+
+        # first value of every faction of every wave, in units of ints
+        self.offsets = array('q', [0])
+        for count in counts:
+            self.offsets.append(self.offsets[-1] + 2 * count)
+
+    def __iter__(self):
+        for index in range(1, self.header[1] + 1):
+            yield self.wave(index)
+
+    def wave(self, index):
+        wave = empty_wave()
+        if 1 <= index <= self.header[1]:
+            for k, faction in enumerate(wave):
+                position = 4 * (index - 1) + k
+                values = iter(self.values[self.offsets[position]:self.offsets[position + 1]])
+                wave[faction] = list(zip(values, values))
+        return wave
+
+
+def is_binary_scenario(input_file):
+    with open(input_file, "rb") as file:
+        return file.read(len(SCENARIO_MAGIC)) == SCENARIO_MAGIC
+
+
+def open_waves(input_file):
+    """
+    Reader of the waves of a text or binary scenario.
+    """
+    if is_binary_scenario(input_file):
+        return BinaryWaveReader(input_file)
+    return WaveReader(input_file)
+
+
+def write_binary_scenario(text_file, binary_file):
+    """
+    Converts a text scenario into the binary one. After SCENARIO_MAGIC come
+    native int32 values: N W T R, the number of units of every faction of
+    every wave in E F W A order, then the x y pairs of all those units in the
+    same order. The text file is read one wave at a time and the counts are
+    written once all the waves are known.
+    """
+    header = [int(value) for value in read_header(text_file)[0].split()[:4]]
+    counts = array('i', bytes(4 * 4 * header[1]))
+    with open(binary_file, "wb") as file:
+        file.write(SCENARIO_MAGIC)
+        array('i', header).tofile(file)
+        counts_position = file.tell()
+        counts.tofile(file)
+        for index, wave in enumerate(read_waves(text_file)):
+            if index == header[1]:
+                break
+            for k, faction in enumerate(wave):
+                counts[4 * index + k] = len(wave[faction])
+                array('i', [value for coordinate in wave[faction] for value in coordinate]).tofile(file)
+        file.seek(counts_position)
+        counts.tofile(file)
+
+
+def allocate_grid_file(output_file, n):
+    """
+    Creates the binary output: one unit type byte per cell of the n x n grid,
+    row by row, without separators. Blocks write their cells into it.
+    """
+    with open(output_file, "wb") as file:
+        file.truncate(n * n)
+
+
+def write_block_cells(output_file, n, top_left, bottom_right, cells):
+    """
+    Writes the cells of a block, one byte per cell row by row as from
+    pack_grid, to its rows of the memory mapped binary output.
+    """
+    width = bottom_right[1] - top_left[1]
+    with open(output_file, "r+b") as file, mmap.mmap(file.fileno(), 0) as grid:
+        for k, x in enumerate(range(top_left[0], bottom_right[0])):
+            grid[x * n + top_left[1]:x * n + bottom_right[1]] = cells[k * width:(k + 1) * width]
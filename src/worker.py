@@ -1,11 +1,31 @@
+import time
+from array import array
 from mpi4py import MPI
 from utils import Utils
-from block import Block
-from unit import Unit, EarthUnit, FireUnit, WaterUnit, AirUnit
-from constants import MESSAGES
+from block import Block, GEOMETRY_SIZE, block_class
+from unit import AirUnit
+from constants import MESSAGES, UNIT_TYPES, ADJACENT_CELLS
+from transport import send_ints, recv_ints, send_records, isend_records, recv_records, scatter_ints, scatter_records
+from grid_output import write_grid
+from checkpoint import checkpoint_file, write_checkpoint, read_checkpoint
+from instrumentation import profile
+from halo import DeltaHalo, message_size, decode
+from deep_halo import DeepHalo
 
 comm = MPI.COMM_WORLD
 
+# States of the manager schedule that run a phase of the simulation, their
+# time is reported for rebalancing
+PHASE_STATES = {2, 4, 6, 7, 8, 10, 12}
+
+# Phase of every state in the --profile report
+STATE_PHASES = {
+    20: 'wave injection', 21: 'end wave', 2: 'boundary exchange',
+    4: 'attack', 6: 'resolution', 7: 'heal', 8: 'flood',
+    10: 'air move', 11: 'air take', 12: 'air place', 13: 'gather',
+    22: 'rebalance', 23: 'checkpoint', -1: 'terminate',
+}
+
 
 def print_grid(grid, rank=None):
     """
@@ -26,418 +46,473 @@ class Worker:
         self.rank = rank
         self.state = 0
         self.block = None
+        self.block_class = Block
         self.new_water_units = set()
         self.new_air_units = []
+        self.rebalance_threshold = 0
+        # seconds spent in the phases since the last wave boundary
+        self.phase_time = 0.0
+        self.halo = DeltaHalo()
 
     def receive_block(self):
         """
-        Receive block data from the Manager (rank 0).
+        Receive block data from the Manager (rank 0), scattered to all workers at once.
         """
-        block_data = comm.recv(source=0, tag=1)
-        self.block: Block = block_data
+        geometry = scatter_ints(comm, None, GEOMETRY_SIZE)
+        self.block: Block = self.block_class.from_geometry(geometry)
+        self.halo.reset()
+        # a restarted run fills the block from the checkpoint with all workers at once
+        if self.restart_file:
+            read_checkpoint(comm, self.restart_file, self.block)
 
     def receive_units(self):
-        units_data = comm.recv(source=0, tag=2)
-        self.block.add_units(units_data)
+        # (faction code, x, y) records, scattered to all workers at once
+        units_data = scatter_records(comm, None, None, 3)
+        self.block.add_units([(UNIT_TYPES[code], x, y) for code, x, y in units_data])
+
+    def receive_state(self):
+        state, current_worker_group = recv_ints(comm, 2, source=0, tag=10)
+        return {'state': state, 'current_worker_group': current_worker_group}
 
-    def extract_block(self, position):
+    def send_active_time_done(self):
+        send_ints(comm, [int(MESSAGES['ACTIVE_TIME_DONE']['message'])],
+                  dest=MESSAGES['ACTIVE_TIME_DONE']['dest'],
+                  tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
+
+    def exchange_with_neighbors(self, outgoing, tag, width):
+        """
+        Sends the records in outgoing[block_id] to every adjacent block and
+        receives exactly one batch back from each of them. Sends are non-blocking
+        so all workers can exchange at the same time without deadlocking.
+        """
+        sends = [isend_records(comm, outgoing[neighbor['block_id']], dest=neighbor['block_id'], tag=tag)
+                 for neighbor in self.block.adjacent_blocks]
+        incoming = {neighbor['block_id']: recv_records(comm, width, source=neighbor['block_id'], tag=tag)
+                    for neighbor in self.block.adjacent_blocks}
+        with profile.blocking():
+            MPI.Request.Waitall([request for request, _ in sends])
+        return incoming
+
+    def post_boundaries(self):
         """
-        Extracts specific 'boundary' sub-grids to send to neighbors.
-        Each position corresponds to a direction around the block:
-          0 -> top-left corner, 1 -> top edge, 2 -> top-right corner, etc.
+        Starts swapping boundaries with all neighbors at once. Boundaries have a
+        fixed size, one byte per cell, so every receive can be posted up front.
+        With --halo delta a message is at most one byte longer, see halo.py.
+        Returns the requests and the receive buffers for finish_boundaries.
         """
-        # Example extraction size is 3x3, but can be adjusted as needed
-        if position == 0:
-            return [row[0:3] for row in self.block.grid[0:3]]
-        elif position == 1:
-            return [row[:] for row in self.block.grid[0:3]]
-        elif position == 2:
-            return [row[-3:] for row in self.block.grid[0:3]]
-        elif position == 3:
-            return [row[-3:] for row in self.block.grid]
-        elif position == 4:
-            return [row[-3:] for row in self.block.grid[-3:]]
-        elif position == 5:
-            return [row[:] for row in self.block.grid[-3:]]
-        elif position == 6:
-            return [row[0:3] for row in self.block.grid[-3:]]
-        elif position == 7:
-            return [row[0:3] for row in self.block.grid]
-        # Default empty if position is somehow out of range
-        return []
+        self.block.reset_boundary()
+        requests = []
+        buffers = {}
+        for neighbor in self.block.adjacent_blocks:
+            rows, columns = self.block.boundary_shape(neighbor['position'])
+            size = message_size(rows * columns) if self.halo_mode == "delta" else rows * columns
+            buffers[neighbor['block_id']] = bytearray(size)
+            requests.append(comm.Irecv(buffers[neighbor['block_id']], source=neighbor['block_id'], tag=10))
+        for neighbor in self.block.adjacent_blocks:
+            send_buffer = self.block.pack_boundary(neighbor['position'])
+            if self.halo_mode == "delta":
+                send_buffer = self.halo.encode(neighbor['block_id'], send_buffer)
+            profile.sent(10, len(send_buffer))
+            requests.append(comm.Isend(send_buffer, dest=neighbor['block_id'], tag=10))
+        return requests, buffers
+
+    def finish_boundaries(self, requests, buffers):
+        statuses = [MPI.Status() for _ in requests]
+        with profile.blocking():
+            MPI.Request.Waitall(requests, statuses)
+        for neighbor, status in zip(self.block.adjacent_blocks, statuses):
+            buffer = buffers[neighbor['block_id']]
+            if self.halo_mode == "delta":
+                decode(self.block, bytes(buffer[:status.Get_count(MPI.BYTE)]), neighbor['position'])
+            else:
+                self.block.unpack_boundary(buffer, neighbor['position'])
 
-    def run(self):
+    def exchange_boundaries(self):
         """
-        Main loop for the worker process.
+        Rebuilds grid_with_boundary by swapping boundaries with all neighbors at once.
         """
+        self.finish_boundaries(*self.post_boundaries())
 
+    def start_round(self, air_moves=None):
+        """
+        Boundary exchange and inferno at the start of a round. The interior of the
+        block does not look at the boundary, so it is handled while the boundaries
+        are in flight and only the ring next to the edge waits for them. If
+        air_moves is given the new positions of the air units are planned into it
+        the same way.
+        """
+        requests, buffers = self.post_boundaries()
+        for region in ('interior', 'ring'):
+            if region == 'ring':
+                self.finish_boundaries(requests, buffers)
+            self.block.apply_inferno(region)
+            if air_moves is not None:
+                air_moves.update(self.block.air_moves(region))
+
+    def receive_config(self):
         config_data = comm.bcast(None, root=0)
         # Update Utils class variables
         Utils.N = config_data['N']
         Utils.W = config_data['W']
         Utils.T = config_data['T']
         Utils.R = config_data['R']
+        Utils.row_cuts = config_data['row_cuts']
+        Utils.column_cuts = config_data['column_cuts']
+        self.block_class = block_class(config_data['grid'])
+        self.rebalance_threshold = config_data['rebalance']
+        self.output_format = config_data['output_format']
+        self.halo_mode = config_data['halo']
+        self.halo_depth = config_data['halo_depth']
+        self.output_file = config_data['output_file']
+        self.checkpoint_every = config_data['checkpoint']
+        self.restart_file = config_data['restart']
+        self.first_wave = config_data['first_wave']
+        Utils.build_block_lookup()
+
+    def attack(self):
+        """
+        Attack phase, all workers at once.
+        """
+        # Air units have moved since the round started, refresh the boundary so
+        # attacks on neighbor cells can be resolved locally
+        with profile.phase('boundary exchange'):
+            self.exchange_boundaries()
+
+        outgoing_damage = {neighbor['block_id']: [] for neighbor in self.block.adjacent_blocks}
+        self.block.attack(outgoing_damage)
+
+        # (x, y, damage) records
+        incoming_damage = self.exchange_with_neighbors(outgoing_damage, tag=70, width=3)
+        with profile.phase('take_damage'):
+            self.block.take_damage(incoming_damage)
+
+    def move_air_units(self, air_moves):
+        """
+        Moves every air unit of the block to the position planned in air_moves,
+        units leaving the block are sent to their new owner in one message per
+        neighbor.
+        """
+        outgoing_air_units = {neighbor['block_id']: [] for neighbor in self.block.adjacent_blocks}
+        for air_unit in self.block.remove_air_units():
+            new_coordinates = air_moves[(air_unit.x, air_unit.y)]
+            air_unit.change_position(new_coordinates)
+            if self.block.is_coordinate_inside(new_coordinates[0], new_coordinates[1]):
+                self.new_air_units.append(air_unit)
+            else:
+                dest_block_id = Utils.coordinates_to_block_id(new_coordinates[0], new_coordinates[1])
+                outgoing_air_units[dest_block_id].append(air_unit.to_record())
+
+        incoming_air_units = self.exchange_with_neighbors(outgoing_air_units, tag=72, width=4)
+        for neighbor in self.block.adjacent_blocks:
+            self.new_air_units.extend(AirUnit.from_record(record)
+                                      for record in incoming_air_units[neighbor['block_id']])
+
+        for air_unit in self.new_air_units:
+            self.block.place_air_unit(air_unit)
+        self.new_air_units.clear()
+
+    def flood(self):
+        """
+        All workers flood at once. The boundaries are swapped first, as the
+        rounds moved and killed units on them, then every water unit picks its
+        target on grid_with_boundary. Targets in other blocks go to them as one
+        batch of (x, y) flood requests per neighbor. A requested cell is flooded
+        when it is empty on the receiving block, and a cell wanted by several
+        water units gets one, so the result does not depend on the order of the
+        requests.
+        """
+        self.exchange_boundaries()
+        requests = {neighbor['block_id']: [] for neighbor in self.block.adjacent_blocks}
+        for x, y in self.block.unit_positions('W'):
+            target = self.flood_target(x, y)
+            if target is None:
+                continue
+            if self.block.is_coordinate_inside(*target):
+                self.new_water_units.add(target)
+            else:
+                requests[Utils.coordinates_to_block_id(*target)].append(target)
+
+        for records in self.exchange_with_neighbors(requests, tag=71, width=2).values():
+            for x, y in records:
+                if self.block.is_empty(x, y):
+                    self.new_water_units.add((x, y))
+
+    def end_wave(self):
+        self.block.place_water_units(self.new_water_units)
+        self.new_water_units.clear()
+        self.block.reset_inferno()
+
+    def run_autonomous(self):
+        """
+        Main loop when workers play the rounds without the manager's states.
+        Phases stay in step through their one message per neighbor exchanges,
+        the manager is only involved in the wave injection and the final gather.
+        """
+        # only the deep halo exchanges need the communicator without the manager
+        worker_comm = comm.Split(0, self.rank)
+        with profile.phase('startup'):
+            self.receive_config()
+            self.receive_block()
+
+        # with --halo-depth the rounds need no message until the next exchange of margins
+        deep_halo = DeepHalo(worker_comm, self.halo_depth) if self.halo_depth else None
+
+        for wave_idx in range(self.first_wave, Utils.W + 1):
+            with profile.phase('wave injection'):
+                self.receive_units()
+            start = time.perf_counter()
+            if deep_halo:
+                deep_halo.play_wave(self.block)
+            else:
+                self.play_wave()
+            self.phase_time += time.perf_counter() - start
+            self.wave_boundary(wave_idx)
+
+        with profile.phase('gather'):
+            self.output_grid()
+
+    # rounds and flooding of a wave of the autonomous schedule
+    def play_wave(self):
+        for _ in range(Utils.R):
+            air_moves = {}
+            with profile.phase('boundary exchange', self.unit_count()):
+                self.start_round(air_moves)
+            with profile.phase('air move', self.unit_count()):
+                self.move_air_units(air_moves)
+            with profile.phase('attack', self.unit_count()):
+                self.attack()
+            with profile.phase('resolution', self.unit_count()):
+                self.block.resolve()
+            with profile.phase('heal', self.unit_count()):
+                self.block.heal()
+        with profile.phase('flood', self.unit_count()):
+            self.flood()
+        with profile.phase('end wave', self.unit_count()):
+            self.end_wave()
+
+    # checkpoint and rebalancing after a wave of the autonomous schedule
+    def wave_boundary(self, wave_idx):
+        if self.checkpoint_every and wave_idx % self.checkpoint_every == 0 and wave_idx < Utils.W:
+            with profile.phase('checkpoint'):
+                self.checkpoint()
+        if self.rebalance_threshold and wave_idx < Utils.W:
+            with profile.phase('rebalance'):
+                self.rebalance()
+
+    # units on the block for the --profile report, only counted when profiling
+    def unit_count(self):
+        return self.block.unit_count() if profile.enabled and self.block else 0
+
+    def checkpoint(self):
+        write_checkpoint(comm, checkpoint_file(self.output_file), block=self.block)
+
+    def rebalance(self):
+        """
+        Wave boundary of the rebalancing: reports the phase time and the units
+        of the block to the manager, per row and column of the grid and in all,
+        then counts them under the new cuts the manager tries, if any, and moves
+        to the block it is given next if the manager repartitions the grid.
+        """
+        comm.Gather([array('d', [self.phase_time]), MPI.DOUBLE], None, root=0)
+        self.phase_time = 0.0
+
+        # units per row of the grid, then per column, the other blocks fill the rest
+        lines = array('i', bytes(2 * Utils.N * array('i').itemsize))
+        rows, columns = self.block.units_per_line()
+        lines[self.block.top_left[0]:self.block.bottom_right[0]] = array('i', rows)
+        lines[Utils.N + self.block.top_left[1]:Utils.N + self.block.bottom_right[1]] = array('i', columns)
+        comm.Reduce([lines, MPI.INT], None, op=MPI.SUM, root=0)
+        comm.Gather([array('i', [self.block.unit_count()]), MPI.INT], None, root=0)
+
+        # [try, row cuts..., column cuts...]
+        candidate = array('i', bytes((Utils.block_rows + Utils.block_columns + 3) * array('i').itemsize))
+        comm.Bcast([candidate, MPI.INT], root=0)
+        if not candidate[0]:
+            return
+        row_cuts, column_cuts = list(candidate[1:Utils.block_rows + 2]), list(candidate[Utils.block_rows + 2:])
+
+        own = (self.block.top_left, self.block.bottom_right)
+        load = array('i', bytes((comm.Get_size() - 1) * array('i').itemsize))
+        for block_id in range(1, comm.Get_size()):
+            cells = Utils.overlap(own, Utils.block_rectangle(block_id, row_cuts, column_cuts))
+            if cells:
+                load[block_id - 1] = self.block.count_units(*cells)
+        comm.Reduce([load, MPI.INT], None, op=MPI.SUM, root=0)
+
+        decision = array('i', [0])
+        comm.Bcast([decision, MPI.INT], root=0)
+        if decision[0]:
+            self.migrate(row_cuts, column_cuts)
+
+    def migrate(self, row_cuts, column_cuts):
+        """
+        Sends every part of the block to the rank that owns it under the new
+        cuts and takes the new block from its old owners, all in one Alltoallv.
+        The manager takes part with nothing to send or receive.
+        """
+        geometry = recv_ints(comm, GEOMETRY_SIZE, source=0, tag=1)
+        old_rectangle = (self.block.top_left, self.block.bottom_right)
+        new_rectangle = Utils.block_rectangle(self.rank, row_cuts, column_cuts)
+
+        size = comm.Get_size()
+        send_parts, send_counts, receive_counts = [], [0] * size, [0] * size
+        incoming = {}
+        for rank in range(1, size):
+            outgoing = Utils.overlap(old_rectangle, Utils.block_rectangle(rank, row_cuts, column_cuts))
+            if outgoing:
+                send_parts.append(self.block.pack_cells(*outgoing))
+                send_counts[rank] = len(send_parts[-1]) // 2
+            incoming[rank] = Utils.overlap(Utils.block_rectangle(rank, Utils.row_cuts, Utils.column_cuts),
+                                           new_rectangle)
+            if incoming[rank]:
+                (x0, y0), (x1, y1) = incoming[rank]
+                receive_counts[rank] = (x1 - x0) * (y1 - y0) * 3
+
+        send_displacements = [sum(send_counts[:rank]) for rank in range(size)]
+        receive_displacements = [sum(receive_counts[:rank]) for rank in range(size)]
+        received = bytearray(2 * sum(receive_counts))
+        comm.Alltoallv([bytearray(b''.join(send_parts)), (send_counts, send_displacements), MPI.SHORT],
+                       [received, (receive_counts, receive_displacements), MPI.SHORT])
+
+        self.block = self.block_class.from_geometry(geometry)
+        self.halo.reset()
+        for rank in range(1, size):
+            if incoming[rank]:
+                start = 2 * receive_displacements[rank]
+                self.block.unpack_cells(*incoming[rank], received[start:start + 2 * receive_counts[rank]])
+
+        Utils.row_cuts, Utils.column_cuts = row_cuts, column_cuts
+        Utils.build_block_lookup()
+        comm.Barrier()
+
+    def output_grid(self):
+        """
+        Final output, the block is written into its rows of the output file by
+        a collective write with the other workers and the manager.
+        """
+        write_grid(comm, self.output_file, self.output_format, self.block)
+        if self.halo_mode == "delta":
+            comm.Reduce([array('d', [self.halo.exchanges, self.halo.bytes, self.halo.full_bytes]), MPI.DOUBLE],
+                        None, op=MPI.SUM, root=0)
+
+    def run(self):
+        """
+        Main loop for the worker process.
+        """
+        with profile.phase('startup'):
+            self.receive_config()
+            self.receive_block()
 
         while True:
             # Receive control/state info from Manager (rank=0)
-            data = comm.recv(source=0, tag=10)
+            with profile.phase('wait for state'):
+                data = self.receive_state()
             self.state = data['state']
+            start = time.perf_counter()
+            profile.start(STATE_PHASES.get(self.state, 'other'), self.unit_count())
 
-            # 1) Receive blocks from manager
-            if self.state == 1:
-                self.receive_block()
-                self.state = 0
-
-            elif self.state == 20: # receive new units from manager
+            if self.state == 20: # receive new units from manager
                 self.receive_units()
                 self.state = 0
             
             elif self.state == 21: # new wave
-                for x, y in self.new_water_units:
-                    grid_x, grid_y = self.block.get_block_coordinates(x, y)
-                    self.block.grid[grid_x][grid_y] = WaterUnit(x, y)
-
-                self.new_water_units.clear()
-
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            fire_unit = self.block.grid[i][j]
-                            if fire_unit.unit_type == 'F':
-                                fire_unit.reset_inferno()
-            # 2) Worker becomes "receiver" of boundary data
+                self.end_wave()
+            # 2) Boundary exchange with all neighbors at once
             elif self.state == 2:
-                self.block.reset_boundary()
-                for neighbor in self.block.adjacent_blocks:
-                    boundary_data = comm.recv(source=neighbor['block_id'], tag=10)
-                    self.block.update_boundary(boundary_data['grid'], neighbor['position'])
-                self.apply_inferno()
-                comm.send(MESSAGES['ACTIVE_TIME_DONE']['message'],
-                          dest=MESSAGES['ACTIVE_TIME_DONE']['dest'],
-                          tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
+                self.start_round()
                 self.state = 0
 
-            # 3) Worker becomes "sender" of boundary data
-            elif self.state == 3:
-                current_group = data['current_worker_group']
-                for neighbor in self.block.adjacent_blocks:
-                    # Only send to neighbors that are also in the active checkerboard group
-                    if Utils.is_current_worker(neighbor['block_id'], current_group):
-                        extracted_data = self.extract_block(neighbor['position'])
-
-                        for i in range(len(extracted_data)):
-                            for j in range(len(extracted_data[0])):
-                                if extracted_data[i][j] != '.':
-                                    extracted_data[i][j] = extracted_data[i][j].unit_type
-                        comm.send({'grid': extracted_data, 'position': neighbor['position']},
-                                  dest=neighbor['block_id'], tag=10)
-                self.state = 0
-
-            # 4) Attack Phase
+            # 4) Attack Phase (all workers at once)
             elif self.state == 4:
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            self.attack(self.block.grid[i][j])
-                comm.send(MESSAGES['ACTIVE_TIME_DONE']['message'],
-                          dest=MESSAGES['ACTIVE_TIME_DONE']['dest'],
-                          tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
-                self.state = 0
-
-            # 5) Take Damage Phase
-            elif self.state == 5:
-                self.take_damage()
+                self.attack()
                 self.state = 0
 
             # 6) Resolution Phase
             elif self.state == 6:
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            unit: Unit = self.block.grid[i][j]
-                            # Example: Earth units may fortify
-                            if unit.unit_type == 'E':
-                                unit: EarthUnit
-                                unit.fortify()
-
-
-
-                            # Apply accumulated damage
-                            unit.health -= unit.damage_taken
-                            unit.damage_taken = 0
-
-                            # Kill unit if health <= 0
-                            if not unit.is_alive():
-                                self.block.grid[i][j] = '.'
+                self.block.resolve()
                 self.state = 0
 
             # 7) Heal Phase
             elif self.state == 7:
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            unit = self.block.grid[i][j]
-
-                            # If the unit hasn't attacked yet, it can heal
-                            if not unit.attack_done:
-                                unit.heal()
-                            # Reset its attack state
-                            unit.attack_done = False
+                self.block.heal()
                 self.state = 0
 
 
-            elif self.state == 8:  # water floods
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            water_unit = self.block.grid[i][j]
-                            if water_unit.unit_type == 'W':
-                                self.create_water_unit(water_unit)
-
-                comm.send(MESSAGES['ACTIVE_TIME_DONE']['message'],
-                          dest=MESSAGES['ACTIVE_TIME_DONE']['dest'],
-                          tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
-                self.state = 0
-
-            elif self.state == 9:
-                self.take_water_unit()
+            elif self.state == 8:  # water floods, all workers at once
+                self.flood()
                 self.state = 0
 
             elif self.state == 10:  # calculate the new position of the air unit
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            air_unit = self.block.grid[i][j]
-                            if air_unit.unit_type == 'A':
-                                new_coordinates = self.air_movement(air_unit)
-                                air_unit.change_position(new_coordinates)
-                                #print(print_grid(self.block.grid_with_boundary, self.rank))
-                                if self.block.is_coordinate_inside(new_coordinates[0], new_coordinates[1]):
-                                    self.new_air_units.append(air_unit)
-                                else:
-                                    self.send_air_unit(air_unit)
-                for i in range(len(self.block.grid)):
-                    for j in range(len(self.block.grid[0])):
-                        if self.block.grid[i][j] != '.':
-                            air_unit = self.block.grid[i][j]
-                            if air_unit.unit_type == 'A':
-                                self.block.grid[i][j] = '.'  # remove the air unit
-                
-                comm.send(MESSAGES['ACTIVE_TIME_DONE']['message'],
-                          dest=MESSAGES['ACTIVE_TIME_DONE']['dest'],
-                          tag=MESSAGES['ACTIVE_TIME_DONE']['tag'])
+                # Every move is planned on grid_with_boundary before any air
+                # unit is taken off the grid
+                air_moves = self.block.air_moves()
+                outgoing_air_units = {neighbor['block_id']: [] for neighbor in self.block.adjacent_blocks}
+                for air_unit in self.block.remove_air_units():
+                    new_coordinates = air_moves[(air_unit.x, air_unit.y)]
+                    air_unit.change_position(new_coordinates)
+                    #print(print_grid(self.block.grid_with_boundary, self.rank))
+                    if self.block.is_coordinate_inside(new_coordinates[0], new_coordinates[1]):
+                        self.new_air_units.append(air_unit)
+                    else:
+                        dest_block_id = Utils.coordinates_to_block_id(new_coordinates[0], new_coordinates[1])
+                        outgoing_air_units[dest_block_id].append(air_unit.to_record())
+
+                # One batch per neighbor, empty ones included, so every inactive
+                # neighbor knows how many messages to wait for
+                for neighbor in self.block.adjacent_blocks:
+                    self.send_air_units(outgoing_air_units[neighbor['block_id']], neighbor['block_id'])
+
+                self.send_active_time_done()
                 self.state = 0
 
             elif self.state == 11:
-                self.take_air_unit()
+                self.take_air_unit(data['current_worker_group'])
                 self.state = 0
 
             elif self.state == 12: # place the air units if they are on the same position unite them
                 for air_unit in self.new_air_units:
-                    x,y = self.block.get_block_coordinates(air_unit.x,air_unit.y)
-                    new_position=self.block.get_grid_element(air_unit.x,air_unit.y)
-                    if new_position == '.':
-                        self.block.grid[x][y]=air_unit
-                    else:
-                        self.block.grid[x][y].unite(air_unit)
-                
+                    self.block.place_air_unit(air_unit)
+
                 self.new_air_units.clear()
                 self.state = 0
 
             # Anything else or termination
             elif self.state == 13:
                 # Send block back to manager (for final collection)
-                comm.send(self.block, dest=0, tag=10)
+                self.output_grid()
 
-            elif self.state == -1:
-                break
-    # creates water unit in an empty cell
-    def create_water_unit(self, water_unit: WaterUnit):
-        directions = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
-        for dx, dy in directions:
-            nx, ny = water_unit.x + dx, water_unit.y + dy
-            if 0 <= nx < Utils.N and 0 <= ny < Utils.N:
-                if self.block.is_coordinate_inside(nx, ny):
-                    if self.block.get_grid_element(nx, ny) == '.':
-                        self.new_water_units.add((nx, ny))
-                        break
-                else:
-                    is_creation_successful = self.send_water_unit(nx, ny)
-                    if is_creation_successful:
-                        break
-
-    # sends water units to the neighbouring process
-    def send_water_unit(self, x, y):
-        dest_block_id = Utils.coordinates_to_block_id(x, y)
-        comm.send([x, y, self.rank], dest=dest_block_id, tag=71)
-        success = comm.recv(source=dest_block_id, tag=71)
-        return success
-
-    # takes water units from a neighbouring process
-    def take_water_unit(self):
-        while True:
-            data = comm.recv(source=MPI.ANY_SOURCE, tag=71)
-            if data is None:
+            elif self.state == 22:  # wave boundary of the rebalancing
+                self.rebalance()
                 self.state = 0
-                return
-
-            x, y, sender_rank = data
-            local_unit = self.block.get_grid_element(x, y)
-            # If the cell is empty, it's a valid target
-            if local_unit == ".":
-                self.new_water_units.add((x, y))
-                comm.send(True, dest=sender_rank, tag=71)
-            else:
-                comm.send(False, dest=sender_rank, tag=71)
-
-    # sends air units to the neighbouring process
-    def send_air_unit(self, air_unit):
-        dest_block_id = Utils.coordinates_to_block_id(air_unit.x, air_unit.y)
-        comm.send(air_unit, dest=dest_block_id, tag=72)
 
-    # takes air units from a neighbouring process
-    def take_air_unit(self):
-        while True:
-            air_unit = comm.recv(source=MPI.ANY_SOURCE, tag=72)
-            if air_unit is None:
+            elif self.state == 23:  # checkpoint at the end of the wave
+                self.checkpoint()
                 self.state = 0
-                return
-
-            self.new_air_units.append(air_unit)
-
-    #calculates the new position of the air unit
-    def air_movement(self, unit: AirUnit):
-        #calculates the number of enemies in range for a given point
-        def calculate_number_of_enemies(x, y):
-            cnt = 0
-            for dx, dy in unit.directions:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < Utils.N and 0 <= ny < Utils.N:
-                    enemy = self.block.get_grid_with_boundary_element(nx, ny)
-                    if enemy == '.':
-                        new_x, new_y = nx + dx, ny + dy
-                        if 0 <= new_x < Utils.N and 0 <= new_y < Utils.N:
-                            new_enemy = self.block.get_grid_with_boundary_element(new_x, new_y)
-                            if new_enemy != '.' and new_enemy != 'A':
-                                cnt += 1
-                    elif enemy != 'A':
-                        cnt += 1
-
-            return cnt
-
-        new_coordinates = (unit.x, unit.y)
-        max_enemies = calculate_number_of_enemies(unit.x, unit.y)
-        directions = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
-        self.block.set_grid_with_boundary_element(unit.x,unit.y,'.')
-        for dx, dy in directions:
-            nx, ny = unit.x + dx, unit.y + dy
-            if 0 <= nx < Utils.N and 0 <= ny < Utils.N:
-                if self.block.get_grid_with_boundary_element(nx, ny) != '.':
-                    continue
-                number_of_enemies = calculate_number_of_enemies(nx, ny)
-                if number_of_enemies > max_enemies:
-                    new_coordinates = (nx, ny)
-                    max_enemies = number_of_enemies
-        self.block.set_grid_with_boundary_element(unit.x, unit.y, 'A')
-        return new_coordinates
-
-    # attacks an enemy in the neighbour process
-    def apply_damage(self, coordinates, unit: Unit):
-        dest_block_id = Utils.coordinates_to_block_id(coordinates[0], coordinates[1])
-        comm.send([coordinates, unit.attack_power, unit.unit_type, unit.x, unit.y, self.rank],
-                  dest=dest_block_id, tag=70)
-        # Wait for confirmation (2 = damage applied, 1 = same faction, 0 = empty cell)
-        success = comm.recv(source=dest_block_id, tag=70)
-        return success
-
-    def take_damage(self):
-        while True:
-            data = comm.recv(source=MPI.ANY_SOURCE, tag=70)
-            if data is None:
-                # No more attack messages
-                self.state = 0
-                return
-
-            coord, damage, enemy_type, attacker_x, attacker_y, attacker_rank = data
-            local_unit = self.block.get_grid_element(coord[0], coord[1])
-            # If the cell is empty or matches the enemy's faction, it's a valid target
-            if local_unit == "." or local_unit.unit_type == enemy_type:
-                # Attack is blocked (friendly or invalid target)
-                if local_unit == ".":
-                    comm.send(0, dest=attacker_rank, tag=70)
-                else:
-                    comm.send(1, dest=attacker_rank, tag=70)#t here is a friend
-            else:
-                # Apply damage
-                local_unit.damage_taken += damage
-                comm.send(2, dest=attacker_rank, tag=70)
-
-    # an attack of a unit
-    def attack(self, unit: Unit):
-        """
-        Handle the logic of a single unit attacking its potential targets.
-        For example, each unit might have 'directions' indicating adjacent cells.
-        If it's an Air unit, it may have extended range, etc.
-        """
 
-        if(not unit.can_attack()):
-            return
-
-        # attacks to a single coordinate in the grid
-        def attack_coord(x, y):
-            # If within the global grid
-            if 0 <= x < Utils.N and 0 <= y < Utils.N:
-                # If target cell is in the same block:
-                if self.block.is_coordinate_inside(x, y):
-                    local_unit = self.block.get_grid_element(x, y)
-                    # If target cell is not empty AND is a different faction
-                    if not (local_unit == "." or local_unit.unit_type == unit.unit_type):
-                        local_unit.damage_taken += unit.attack_power
-                        unit.attack_done = True
-                        return 2
-                    elif local_unit != ".":
-                        return 1
-                else:
-                    # Otherwise, send damage to another block
-                    number = self.apply_damage((x, y), unit)
-                    if number == 2:
-                        unit.attack_done = True
-                        return 2
-                    elif number == 1:
-                        return 1 # The grid is full
-            return 0
-
-        # Attack each direction once; if Air unit, it may continue
-        for dx, dy in unit.directions:
-            nx, ny = unit.x + dx, unit.y + dy
-            did_attack = attack_coord(nx, ny)
-            if did_attack == 2 and unit.unit_type == 'F':
-                unit.enemies_attacked.append((nx, ny))
-
-            # Example: Air unit can "pierce" one more cell
-            if did_attack == 0 and unit.unit_type == 'A':
-                nx2, ny2 = nx + dx, ny + dy
-                attack_coord(nx2, ny2)
-
-    # applies inferno to all the fire units
-    def apply_inferno(self):
-
-        # checks if the attacked enemy is dead
-        def is_inferno_available(unit: FireUnit):
-            for [row, column] in unit.enemies_attacked:
-                enemy = self.block.get_grid_with_boundary_element(row, column)
-                if enemy == '.':
-                    return True
-
-            return False
-
-        for i in range(len(self.block.grid)):
-            for j in range(len(self.block.grid[0])):
-                if self.block.grid[i][j] != '.':
-                    unit = self.block.grid[i][j]
-                    if unit.unit_type == 'F':
-                        if is_inferno_available(unit):
-                            unit.inferno()
-
-                        unit.reset_enemies_attacked()
+            elif self.state == -1:
+                profile.stop()
+                break
 
+            profile.stop()
+            if data['state'] in PHASE_STATES:
+                self.phase_time += time.perf_counter() - start
+    # first empty cell of ADJACENT_CELLS next to the water unit at (x, y), None if there is none
+    def flood_target(self, x, y):
+        for dx, dy in ADJACENT_CELLS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < Utils.N and 0 <= ny < Utils.N and self.block.get_grid_with_boundary_element(nx, ny) == '.':
+                return nx, ny
+        return None
+
+    # sends the air units leaving for a neighbouring process as one batch
+    def send_air_units(self, records, dest_block_id):
+        send_records(comm, records, dest=dest_block_id, tag=72)
+
+    # takes one batch of air units from each active neighbouring process
+    def take_air_unit(self, current_group):
+        active_neighbors = [neighbor['block_id'] for neighbor in self.block.adjacent_blocks
+                            if Utils.is_current_worker(neighbor['block_id'], current_group)]
+        for block_id in active_neighbors:
+            for record in recv_records(comm, 4, source=block_id, tag=72):
+                self.new_air_units.append(AirUnit.from_record(record))
+        self.state = 0